@@ -3,8 +3,6 @@ from pprint import pprint
 from django.apps import AppConfig
 from collections import Counter
 
-from django_path_converters.converters import ModelConverter, NullConverterMixin, ModelLoadMixin, BaseConverter
-
 
 class PathConvertersConfig(AppConfig):
     name = 'django_path_converters'
@@ -13,8 +11,13 @@ class PathConvertersConfig(AppConfig):
     def ready(self):
         import django_path_converters.converters  # noqa
         from django.apps import apps
+        from django.db.models.signals import post_delete, post_save
+        from django.conf import settings
+        from .cache import invalidate_object
+        from .instrumentation import install_converter_stats
+        from .registry import MODEL_CONVERTERS_SETTING, add_model_converter_specs, materialize_converters
         from django.urls.converters import StringConverter, UUIDConverter
-        from .converters import IntConverter, FullIntConverter, PathConverter, BoolConverter, DateConverter, LazyLoadMixin
+        from .converters import IntConverter, FullIntConverter, PathConverter, BoolConverter, DateConverter, get_model_index
         from django.db.models.fields import AutoField, BooleanField, CharField, DateField, FilePathField, IntegerField, UUIDField
 
         for field, converter in (
@@ -29,35 +32,25 @@ class PathConvertersConfig(AppConfig):
             if not hasattr(field, 'primary_path_converter'):
                 setattr(field, 'primary_path_converter', converter)
 
+        post_save.connect(invalidate_object, dispatch_uid='django_path_converters.invalidate_object')
+        post_delete.connect(invalidate_object, dispatch_uid='django_path_converters.invalidate_object')
+
         counter = Counter(model._meta.model_name for model in apps.get_models())
         for model in apps.get_models():
-            for field_rel in model._meta.get_fields():
-                field = getattr(field_rel, 'field', field_rel)
-                nullable_class = ()
-                if field.unique and hasattr(field, 'primary_path_converter'):
-                    base_path_converter = field.primary_path_converter
-                    if field.null:
-                        nullable_class = (NullConverterMixin,)
-                    if counter[model._meta.model_name] == 1:
-                        names = (f'{model._meta.app_label}.{model._meta.model_name}', f'{model._meta.model_name}')
-                    else:
-                        names = (f'{model._meta.app_label}.{model._meta.model_name}',)
-                    if field.primary_key:
-                        suffixes = (f'.{field.name}', '')
-                    else:
-                        suffixes = (f'.{field.name}',)
-                    for _name in names:
-                        for suffix in suffixes:
-                            class ModelConverter(*nullable_class, ModelLoadMixin, base_path_converter, BaseConverter):  # noqa
-                                name = _name
-                                model_class = model
-                                field_name = field.name
-                                name_suffix = suffix
-                                from_types = to_types = (model,)
-
-                            class ModelConverter(*nullable_class, LazyLoadMixin, base_path_converter, BaseConverter):  # noqa
-                                name = _name
-                                model_class = model
-                                field_name = field.name
-                                name_suffix = suffix
-                                from_types = to_types = (model,)
\ No newline at end of file
+            if counter[model._meta.model_name] == 1:
+                names = (f'{model._meta.app_label}.{model._meta.model_name}', f'{model._meta.model_name}')
+            else:
+                names = (f'{model._meta.app_label}.{model._meta.model_name}',)
+            add_model_converter_specs(model, names)
+
+        # the generic model converters look up the models in an index, instead of in the app registry
+        get_model_index()
+
+        # create all converters, or only those listed in the settings, such that a project with many models does not
+        # create thousands of classes that no path uses
+        model_converters = getattr(settings, MODEL_CONVERTERS_SETTING, '__all__')
+        if model_converters == '__all__':
+            model_converters = None
+        materialize_converters(model_converters)
+        # the converters that were registered before the settings were configured
+        install_converter_stats()
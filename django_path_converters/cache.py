@@ -0,0 +1,291 @@
+from collections import Counter, OrderedDict
+from hashlib import md5
+from threading import Lock
+from time import monotonic, time_ns
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import router
+from django.db.models import Model
+
+from django_path_converters.utils import get_unique_field
+
+OBJECT_CACHE_SETTING = 'PATH_CONVERTERS_OBJECT_CACHE'
+NEGATIVE_CACHE_SETTING = 'PATH_CONVERTERS_NEGATIVE_CACHE'
+
+
+class ModelObjectCache:
+    """
+    A cache for the objects loaded by the model converters, shared between requests.
+
+    Entries are keyed by the model, the lookup field, the value and the database alias, and
+    are stored in one of the Django caches, which evicts these by its own limits. Each row
+    has a version key, an entry is only used if it has the current version of its row, and
+    saving or deleting the row increments the version, such that this works across processes.
+    """
+
+    def __init__(self, cache='default', timeout=300, models=None, key_prefix='path_converters'):
+        self.cache_alias = cache
+        self.timeout = timeout
+        if isinstance(models, (list, tuple, set)):
+            models = {label: {} for label in models}
+        self.models = None if models is None else {label.lower(): options for label, options in models.items()}
+        self.key_prefix = key_prefix
+        self.hits = Counter()
+        self.misses = Counter()
+        self._model_options = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_model_options(self, model):
+        # the timeout for the model, None if the model is not cached
+        try:
+            return self._model_options[model]
+        except KeyError:
+            pass
+        label = model._meta.label_lower
+        if self.models is None:
+            result = self.timeout
+        elif label in self.models:
+            result = self.models[label].get('TIMEOUT', self.timeout)
+        else:
+            result = None
+        self._model_options[model] = result
+        return result
+
+    def make_key(self, model, field, value, db):
+        digest = md5(str(field.to_python(value)).encode(), usedforsecurity=False).hexdigest()
+        return f'{self.key_prefix}:{model._meta.label_lower}:{db}:{field.name}:{digest}'
+
+    def make_row_key(self, model, pk, db):
+        return self.make_key(model, model._meta.pk, pk, f'{db}:row')
+
+    def _lookup(self, model_or_queryset, field_name):
+        # only plain models are cached: a (custom) queryset might filter out the cached object
+        if not isinstance(model_or_queryset, type) or not issubclass(model_or_queryset, Model):
+            return None
+        timeout = self.get_model_options(model_or_queryset)
+        if timeout is not None:
+            field = get_unique_field(model_or_queryset, field_name)
+            if field is not None:
+                # keyed by the database the row is written to, which is the one post_save invalidates, also if
+                # the object is read from a replica
+                return field, router.db_for_write(model_or_queryset), timeout
+
+    def _record(self, model, result):
+        if result is None:
+            self.misses[model._meta.label_lower] += 1
+        else:
+            self.hits[model._meta.label_lower] += 1
+        return result
+
+    @staticmethod
+    def new_version():
+        # the first version of a row, different from the versions of an earlier version key that was evicted
+        return time_ns()
+
+    def get(self, model_or_queryset, field_name, value):
+        lookup = self._lookup(model_or_queryset, field_name)
+        if lookup is None:
+            return None
+        field, db, timeout = lookup
+        cache = self.cache
+        entry = cache.get(self.make_key(model_or_queryset, field, value, db))
+        result = None
+        if entry is not None:
+            version, obj = entry
+            if cache.get(self.make_row_key(model_or_queryset, obj.pk, db)) == version:
+                result = obj
+        return self._record(model_or_queryset, result)
+
+    async def aget(self, model_or_queryset, field_name, value):
+        lookup = self._lookup(model_or_queryset, field_name)
+        if lookup is None:
+            return None
+        field, db, timeout = lookup
+        cache = self.cache
+        entry = await cache.aget(self.make_key(model_or_queryset, field, value, db))
+        result = None
+        if entry is not None:
+            version, obj = entry
+            if await cache.aget(self.make_row_key(model_or_queryset, obj.pk, db)) == version:
+                result = obj
+        return self._record(model_or_queryset, result)
+
+    def set(self, model_or_queryset, field_name, obj):
+        lookup = self._lookup(model_or_queryset, field_name)
+        if lookup is None:
+            return
+        field, db, timeout = lookup
+        cache = self.cache
+        row_key = self.make_row_key(model_or_queryset, obj.pk, db)
+        # add does not overwrite the version of another process
+        cache.add(row_key, self.new_version(), None)
+        version = cache.get(row_key)
+        if version is not None:
+            cache.set(self.make_key(model_or_queryset, field, getattr(obj, field.attname), db), (version, obj), timeout)
+
+    async def aset(self, model_or_queryset, field_name, obj):
+        lookup = self._lookup(model_or_queryset, field_name)
+        if lookup is None:
+            return
+        field, db, timeout = lookup
+        cache = self.cache
+        row_key = self.make_row_key(model_or_queryset, obj.pk, db)
+        await cache.aadd(row_key, self.new_version(), None)
+        version = await cache.aget(row_key)
+        if version is not None:
+            await cache.aset(self.make_key(model_or_queryset, field, getattr(obj, field.attname), db), (version, obj), timeout)
+
+    def invalidate(self, instance, using):
+        model = type(instance)
+        if self.get_model_options(model) is None:
+            return
+        try:
+            # atomic in the cache backends, the entries of all lookups of the row get outdated
+            self.cache.incr(self.make_row_key(model, instance.pk, using))
+        except ValueError:
+            # without a version, no entry of the row is used
+            pass
+
+    def stats(self):
+        labels = {*self.hits, *self.misses}
+        return {label: {'hits': self.hits[label], 'misses': self.misses[label]} for label in sorted(labels)}
+
+    def reset_stats(self):
+        self.hits.clear()
+        self.misses.clear()
+
+
+class NegativeLookupCache:
+    """
+    Remembers the lookups of the model converters that found no object, such that repeating them raises a 404
+    without a query.
+
+    The misses are kept in this process, at most `max_entries` per model, the least recently used ones are evicted,
+    and a miss expires after `timeout` seconds. Saving an object removes the misses of its unique values.
+    """
+
+    def __init__(self, timeout=30, max_entries=4096, models=None):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.models = None if models is None else {label.lower() for label in models}
+        self.rejected = Counter()
+        self._misses = {}
+        self._lock = Lock()
+
+    def _key(self, model_or_queryset, field_name, value):
+        # the key of the lookup, None if it is not cached, only plain models are: a queryset might filter the object
+        if not isinstance(model_or_queryset, type) or not issubclass(model_or_queryset, Model):
+            return None
+        if self.models is not None and model_or_queryset._meta.label_lower not in self.models:
+            return None
+        field = get_unique_field(model_or_queryset, field_name)
+        if field is None:
+            return None
+        try:
+            value = field.to_python(value)
+        except Exception:
+            return None
+        return router.db_for_write(model_or_queryset), field.name, value
+
+    def rejects(self, model_or_queryset, field_name, value):
+        # True if the lookup recently found no object
+        misses = self._misses.get(model_or_queryset)
+        if not misses:
+            return False
+        key = self._key(model_or_queryset, field_name, value)
+        with self._lock:
+            expires = misses.get(key)
+            if expires is None:
+                return False
+            if expires <= monotonic():
+                del misses[key]
+                return False
+            misses.move_to_end(key)
+        self.rejected[model_or_queryset._meta.label_lower] += 1
+        return True
+
+    def add(self, model_or_queryset, field_name, value):
+        key = self._key(model_or_queryset, field_name, value)
+        if key is None:
+            return
+        with self._lock:
+            misses = self._misses.setdefault(model_or_queryset, OrderedDict())
+            misses[key] = monotonic() + self.timeout
+            misses.move_to_end(key)
+            while len(misses) > self.max_entries:
+                misses.popitem(last=False)
+
+    def invalidate(self, instance, using):
+        model = type(instance)
+        misses = self._misses.get(model)
+        if not misses:
+            return
+        keys = [(using, field.name, getattr(instance, field.attname)) for field in model._meta.concrete_fields if field.unique]
+        with self._lock:
+            for key in keys:
+                misses.pop(key, None)
+
+    def stats(self):
+        labels = {*self.rejected, *(model._meta.label_lower for model in self._misses)}
+        sizes = {model._meta.label_lower: len(misses) for model, misses in self._misses.items()}
+        return {label: {'rejected': self.rejected[label], 'entries': sizes.get(label, 0)} for label in sorted(labels)}
+
+    def reset_stats(self):
+        self.rejected.clear()
+
+
+_object_cache = None
+_object_cache_loaded = False
+_negative_cache = None
+_negative_cache_loaded = False
+
+
+def get_object_cache():
+    global _object_cache, _object_cache_loaded
+    if not _object_cache_loaded:
+        config = getattr(settings, OBJECT_CACHE_SETTING, None)
+        if config is True:
+            config = {}
+        if config is not None and config is not False:
+            _object_cache = ModelObjectCache(**{key.lower(): value for key, value in config.items()})
+        _object_cache_loaded = True
+    return _object_cache
+
+
+def get_negative_cache():
+    global _negative_cache, _negative_cache_loaded
+    if not _negative_cache_loaded:
+        config = getattr(settings, NEGATIVE_CACHE_SETTING, None)
+        if config is True:
+            config = {}
+        if config is not None and config is not False:
+            _negative_cache = NegativeLookupCache(**{key.lower(): value for key, value in config.items()})
+        _negative_cache_loaded = True
+    return _negative_cache
+
+
+def reset_object_cache(*args, setting=None, **kwargs):
+    global _object_cache, _object_cache_loaded, _negative_cache, _negative_cache_loaded
+    if setting is None or setting == OBJECT_CACHE_SETTING:
+        _object_cache = None
+        _object_cache_loaded = False
+    if setting is None or setting == NEGATIVE_CACHE_SETTING:
+        _negative_cache = None
+        _negative_cache_loaded = False
+
+
+def invalidate_object(sender, instance, using, **kwargs):
+    object_cache = get_object_cache()
+    if object_cache is not None:
+        object_cache.invalidate(instance, using)
+    negative_cache = get_negative_cache()
+    if negative_cache is not None:
+        negative_cache.invalidate(instance, using)
+
+
+setting_changed.connect(reset_object_cache)
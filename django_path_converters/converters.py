@@ -2,37 +2,46 @@ from datetime import date, datetime
 import re
 from enum import Enum
 from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import Iterable
 
 from django.contrib.admin.utils import quote
+from django.core.exceptions import ValidationError
 from django.db.models import Model, Q
-from django.db.models.enums import ChoicesMeta
+from django.db.models.signals import class_prepared
 from django.db.models.query import QuerySet
 from django.db.models.manager import Manager
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.urls import register_converter
-from django.urls.converters import DEFAULT_CONVERTERS, SlugConverter, IntConverter
+from django.urls.converters import DEFAULT_CONVERTERS, REGISTERED_CONVERTERS, SlugConverter, IntConverter, StringConverter
 from django.utils.text import slugify
 from django.db.models.options import Options
 
-from django_path_converters.lazymodelobject import ModelLazyObject
+from django_path_converters.cache import get_negative_cache, get_object_cache
+from django_path_converters.dateparse import parse_datetime
+from django_path_converters.instrumentation import instrument_converter
+from django_path_converters.lazymodelobject import LookupPlan, ModelLazyList, ModelLazyObject, get_lookup_plan
+from django_path_converters.regexes import fold_case, matches_containing, optimize_regex, regex_optimization_enabled, trie_regex
+from django_path_converters.routing import pin_writes, read_queryset
 
 import json
 
-from django_path_converters.utils import strip_capture_groups, wrap_tuple
+from django_path_converters.utils import project_queryset, strip_capture_groups, wrap_tuple
 
 
 class PathConverter(type):
     registered = []
+    pending_registrations = None
     check_regex = True
     check_examples = True
 
-    def __new__(cls, name, bases, attrs):
+    def __new__(cls, name, bases, attrs, **kwargs):
         if cls.check_regex and 'regex' in attrs:
             # validate regex
             rgx = re.compile(attrs['regex'])
-            attrs['regex'] = rgx.pattern  # might be simplified (in future)
+            attrs['regex'] = rgx.pattern
         if 'accepts' in attrs and not isinstance(attrs['accepts'], (list, tuple)):
             attrs['accepts'] = (attrs['accepts'],)
         if 'from_types' in attrs:
@@ -43,16 +52,49 @@ class PathConverter(type):
         # wrap in a tuple in case of a single example
         if isinstance(examples, str):
             examples = attrs['examples'] = (examples,)
-        klass = super().__new__(cls, name, bases, attrs)
+        # the keyword arguments of the class are passed to __init_subclass__, like the choices of a ChoicesConverter
+        klass = super().__new__(cls, name, bases, attrs, **kwargs)
+        if cls.check_regex and 'regex' in klass.__dict__ and regex_optimization_enabled():
+            # the regex might also be set by __init_subclass__, so we simplify it once the class is created
+            klass.regex = optimize_regex(klass.regex)
         for to_type in klass.to_types:
             assert issubclass(to_type, klass.from_types)
         name = attrs.get('name')
         if name:
             klass.name = name = f'{getattr(klass, "name_prefix", "")}{name}{getattr(klass, "name_suffix", "")}'
-            register_converter(klass, name)
-            cls.registered.append(klass)
+            PathConverter.register(klass, name)
         return klass
 
+    @staticmethod
+    def register(klass, name):
+        PathConverter.registered.append(klass)
+        if PathConverter.pending_registrations is None:
+            register_converter(klass, name)
+            instrument_converter(name, REGISTERED_CONVERTERS[name])
+        else:
+            PathConverter.pending_registrations[name] = klass
+
+    @staticmethod
+    @contextmanager
+    def bulk_registration():
+        # register all converters created in the block at once, such that Django's caches are cleared only once
+        if PathConverter.pending_registrations is not None:
+            yield
+            return
+        pending = PathConverter.pending_registrations = {}
+        try:
+            yield
+        finally:
+            PathConverter.pending_registrations = None
+            if pending:
+                from django.urls import converters, resolvers
+                converters.REGISTERED_CONVERTERS.update((name, klass()) for name, klass in pending.items())
+                for name in pending:
+                    instrument_converter(name, converters.REGISTERED_CONVERTERS[name])
+                converters.get_converters.cache_clear()
+                if hasattr(resolvers._route_to_regex, 'cache_clear'):
+                    resolvers._route_to_regex.cache_clear()
+
     def format_type(cls, klass):
         if klass.__module__ != 'builtins':
             return f'{klass.__module__}.{klass.__qualname__}'
@@ -84,6 +126,7 @@ class BaseConverter(metaclass=PathConverter):
     name_suffix = ''
     help = ''
     pass_str = True
+    reverse_safe = False  # to_url always produces a fragment that matches the regex
     to_types = ()
     from_types = ()
     examples = ()
@@ -140,6 +183,7 @@ class NullConverterMixin:
 
 class BoolConverter(BaseConverter):
     yeas = {'yes', 'true', 't', 'y', '1', 'on'}
+    reverse_safe = True
     regex = '[Yy]([Ee][Ss])?|[Tt]([Rr][Uu][Ee])?|[Oo][Nn]|1|[Ff]([Aa][Ll][Ss][Ee])?|[Nn][Oo]?|[Oo][Ff][Ff]|0'
     name = 'bool'
     help = 'A boolean, can check the truthiness of any object, and thus also work with a list for example.'
@@ -171,15 +215,27 @@ class MetaCombinedConverter(type(BaseConverter)):
             constructor = attrs['constructor'] = cls.tuple_constructor(attrs['name'], list(subs))
             attrs['to_types'] = (constructor,)
             attrs['from_types'] = (Iterable,)
-            attrs['regex'] = cls.path_separator_regex.join([f'(?P<{k}>{strip_capture_groups(v.regex)})' for k, v in subs.items()])
+            attrs['regex'] = regex = cls.path_separator_regex.join([f'(?P<{k}>{strip_capture_groups(v.regex)})' for k, v in subs.items()])
+            attrs['_matcher'] = re.compile(regex).fullmatch
+            attrs['_to_pythons'] = tuple(sub.to_python for sub in subs.values())
+            attrs['_to_urls'] = tuple(sub.to_url for sub in subs.values())
+            # if the separator is a literal, we can split on it, unless a part contains the separator as well
+            attrs['_split_separator'] = cls.path_separator if cls.path_separator_regex == re.escape(cls.path_separator) else None
+            attrs['_path_separator'] = cls.path_separator
         return super().__new__(cls, name, bases, attrs)
 
 class CombinedBaseConverter(BaseConverter, metaclass=MetaCombinedConverter):
     def to_python(self, value):
-        _match = re.match(self.regex, value)
-        return self.constructor(**{k: v.to_python(_match.group(k)) for k, v in self._subconverters.items()})
+        separator = self._split_separator
+        if separator is not None:
+            parts = value.split(separator)
+            if len(parts) == len(self._to_pythons):
+                return self.constructor._make([to_python(part) for to_python, part in zip(self._to_pythons, parts)])
+        _match = self._matcher(value)
+        return self.constructor._make([to_python(_match.group(k)) for to_python, k in zip(self._to_pythons, self._subconverters)])
+
     def to_url(self, value):
-        return type(self).path_separator.join(conv.to_url(val) for conv, val in zip(self._subconverters.values(), value))
+        return self._path_separator.join([to_url(val) for to_url, val in zip(self._to_urls, value)])
 
 
 COLON_REGEX = '[:]?'
@@ -239,19 +295,7 @@ class DateTimeConverter(BaseConverter):
     help = 'A datetime stamp as specified by ISO 8601.'
 
     def to_python(self, value, date_format=None):
-        date_format = date_format or self.date_format
-        if isinstance(date_format, str):
-            date_format = (date_format,)
-            notLast = False
-        else:
-            notLast = len(date_format) - 1
-        for date_frm in date_format:
-            try:
-                return datetime.strptime(value, date_frm)
-            except ValueError:
-                if not notLast:
-                    raise
-                notLast -= 1
+        return parse_datetime(value, date_format or self.date_format)
 
     def inner_to_url(self, value):
         date_format = self.date_format
@@ -288,10 +332,15 @@ class WeekConverter(DateConverter):
     examples = '2023-W03'
     week_format = '%u'
     week_day = '1'
+    week_date_format = '%G-W%V%u'
     help = 'A date object, works with the %G-W%V format.'
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.week_date_format = f'{cls.date_format}{cls.week_format}'
+
     def to_python(self, value, date_format=None):
-        return super().to_python(f'{value}{self.week_day}', date_format or f'{self.date_format}{self.week_format}')
+        return super().to_python(f'{value}{self.week_day}', date_format or self.week_date_format)
 
 
 class DateRangeConverter(CombinedBaseConverter):
@@ -302,6 +351,20 @@ class DateRangeConverter(CombinedBaseConverter):
     help = 'A range of two dates, specified by two %Y-%m-%d formats separated by a slash.'
 
 
+@lru_cache(maxsize=None)
+def get_model_index():
+    # the models by app label and (lower case) model name, built once all models are loaded
+    from django.apps import apps
+    return {f'{model._meta.app_label}/{model._meta.model_name}': model for model in apps.get_models(include_auto_created=True)}
+
+
+def clear_model_index(*args, **kwargs):
+    get_model_index.cache_clear()
+
+
+class_prepared.connect(clear_model_index)
+
+
 class ModelConverter(BaseConverter):
     name = 'model'
     regex = '[^/]+/[^/]+'
@@ -311,13 +374,16 @@ class ModelConverter(BaseConverter):
     help = 'A model class, not object, specified with the app name, a slash and the name of the model.'
 
     def to_python(self, value):
-        from django.apps import apps
-        app_label, model_name = value.split('/', 1)
-        try:
-            return apps.get_model(app_label=app_label, model_name=model_name)
-        except LookupError as e:
-            # use a ValueError such that Django can continue looking for a match
-            raise ValueError(*e.args)
+        index = get_model_index()
+        model = index.get(value)
+        if model is None:
+            # the model name is case insensitive, like for apps.get_model
+            app_label, model_name = value.split('/', 1)
+            model = index.get(f'{app_label}/{model_name.lower()}')
+            if model is None:
+                # use a ValueError such that Django can continue looking for a match
+                raise ValueError(f"No installed model '{model_name}' in the app '{app_label}'.")
+        return model
 
     def inner_to_url(self, value):
         if isinstance(value, (Manager, QuerySet)):
@@ -336,7 +402,7 @@ class ObjectConverter(ModelConverter):
     help = 'A model object, specified by the app, the model name, and the primary key of that object, the three items are separated by slashes.'
 
     def create_object(self, model, pk):
-        return get_object_or_404(model, pk=pk)
+        return pin_writes(get_object_or_404(read_queryset(model), pk=pk))
 
     def to_python(self, value):
         model, pk = value.rsplit('/', 1)
@@ -344,7 +410,7 @@ class ObjectConverter(ModelConverter):
         if self.manager is not None:
             model = getattr(model, self.manager)
         try:
-            return get_object_or_404(model, pk=pk)
+            return self.create_object(model, pk)
         except Http404 as e:
             raise ValueError(*e.args)
 
@@ -358,16 +424,99 @@ class LazyObjectConverter(ObjectConverter):
     check_field = True
 
     def create_object(self, model, pk):
-        return ModelLazyObject(model, pk, pk_field=self.pk_field, check_field=self.check_field)
+        plan = get_lookup_plan(model, self.pk_field, self.check_field)
+        # the key is converted to the type of the field, such that the pk of the lazy object equals that of the object
+        if plan.field is not None:
+            try:
+                pk = plan.field.to_python(pk)
+            except ValidationError as e:
+                raise ValueError(*e.messages)
+        return ModelLazyObject.from_plan(plan, pk)
+
+
+def flatten_choices(choices):
+    # the values of an Enum, or of (grouped) choices like those of a model field, as a list of pairs or a dict
+    if isinstance(choices, type) and issubclass(choices, Enum):
+        yield from choices
+        return
+    if isinstance(choices, dict):
+        choices = choices.items()
+    for choice in choices:
+        if isinstance(choice, (list, tuple)):
+            value, label = choice
+            if isinstance(label, (list, tuple, dict)):
+                yield from flatten_choices(label)
+            else:
+                yield value
+        else:
+            yield choice
 
 
 class ChoicesConverter(BaseConverter):
+    """
+    One of the given choices: an Enum (or Django Choices), (value, label) pairs or plain values. The regex and the
+    lookups in both directions are built once, when the class is created.
+    """
     name_prefix = 'choices_'
+    choices = None
+    ignore_case = False
+    pass_str = False
+    reverse_safe = True
+    _to_python = _to_url = None
 
-    def __init_subclass__(cls, choices, **kwargs):
-        if isinstance(choices, ChoicesMeta):
-            pass  # TODO
-        super().__init_subclass__(cls, **kwargs)
+    def __init_subclass__(cls, choices=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if choices is not None:
+            cls.choices = choices
+        choices = cls.get_choices()
+        if choices is not None:
+            cls.build_lookups(choices)
+
+    @classmethod
+    def get_choices(cls):
+        return cls.choices
+
+    @classmethod
+    def build_lookups(cls, choices):
+        to_python, to_url, urls = {}, {}, []
+        # the choices by value, 1 and True are different choices, but the same key of to_url
+        seen = {}
+        for value in flatten_choices(choices):
+            if value is None:
+                continue
+            url = str(value.value if isinstance(value, Enum) else value)
+            key = fold_case(url) if cls.ignore_case else url
+            if key in to_python:
+                raise ValueError(f'The choices {to_python[key]!r} and {value!r} have the same URL {url!r}.')
+            if value in seen:
+                raise ValueError(f'The choices {seen[value]!r} and {value!r} are equal, but have different URLs.')
+            seen[value] = value
+            to_python[key] = value
+            to_url[value] = url
+            urls.append(url)
+            if isinstance(value, Enum):
+                to_url.setdefault(value.value, url)
+            to_url.setdefault(url, url)
+        cls._to_python, cls._to_url = to_python, to_url
+        cls.regex = trie_regex(urls, cls.ignore_case)
+        cls.to_types = tuple(dict.fromkeys(type(value) for value in to_python.values()))
+        cls.from_types = tuple(dict.fromkeys((*cls.to_types, *(type(value.value) for value in to_python.values() if isinstance(value, Enum)), str)))
+        if 'examples' not in cls.__dict__:
+            cls.examples = tuple(urls[:3])
+
+    def to_python(self, value):
+        try:
+            return self._to_python[fold_case(value) if self.ignore_case else value]
+        except KeyError:
+            raise ValueError(f'{value!r} is not one of the choices.')
+
+    def to_url(self, value):
+        try:
+            return self._to_url[value]
+        except (KeyError, TypeError):
+            if self.ignore_case and isinstance(value, str) and fold_case(value) in self._to_python:
+                return self._to_url[self._to_python[fold_case(value)]]
+            raise ValueError(f'{value!r} is not one of the choices.')
 
 
 class EmailConverter(BaseConverter):
@@ -376,59 +525,182 @@ class EmailConverter(BaseConverter):
     from_types = to_types = (str,)
     examples = ('info@djangoproject.com', 'test@foo.org')
 
-class EnumConverter(BaseConverter):
+
+class EnumConverter(ChoicesConverter):
     name_prefix = 'enum_'
     enum_class = None
 
-    def __init_subclass__(cls, enum_class=None, name=None, **kwargs):
-        cls.enum_class = enum_class or cls.enum_class
-        if not issubclass(enum_class, Enum):
-            raise ValueError('The enum_class must be a subclass of Enum')
-        setattr(cls, 'regex', '|'.join(re.escape(v) for v in enum_class.values))
+    def __init_subclass__(cls, enum_class=None, **kwargs):
+        enum_class = cls.enum_class = enum_class or cls.enum_class
+        if enum_class is not None:
+            if not isinstance(enum_class, type) or not issubclass(enum_class, Enum):
+                raise ValueError('The enum_class must be a subclass of Enum')
+            kwargs.setdefault('choices', enum_class)
         super().__init_subclass__(**kwargs)
 
-    def to_python(self, value):
-        if isinstance(value, str):
-            return self.enum_class(value)
-        return super().to_python(value)
 
-    def inner_to_url(self, value):
-        if isinstance(value, self.enum_class):
-            return value.value
-        return value
+class ModelChoicesMixin:
+    # the choices of a model field, for the converters that are created for the fields with choices
+    model_class = None
+    field_name = None
 
+    @classmethod
+    def get_choices(cls):
+        if cls.model_class is not None:
+            return cls.model_class._meta.get_field(cls.field_name).flatchoices
+        return super().get_choices()
 
-class ModelLoadMixin:
-    name_prefix = 'eager_'
+
+class QuerySetLoadMixin:
     model_class = None
     field_name = None
-    
+    only = ()
+    defer = ()
+    select_related = ()
+    prefetch_related = ()
+
     @property
     def accepts(self):
         return (self.model_class,)
 
-    def to_python(self, value):
-        try:
-            return get_object_or_404(self.model_class, Q((self.field_name, super().to_python(value))))
-        except self.model_class.DoesNotExist as e:
-            raise ValueError(*e.args)
+    def get_queryset(self):
+        # created once per converter, such that the batch loader can load the objects of the same converter together
+        klass = type(self)
+        queryset = klass.__dict__.get('_queryset')
+        if queryset is None:
+            if self.only or self.defer or self.select_related or self.prefetch_related:
+                queryset = project_queryset(self.model_class, self.only, self.defer, self.select_related, self.prefetch_related)
+            else:
+                queryset = self.model_class
+            klass._queryset = queryset
+        return queryset
+
+    def to_key(self, value):
+        # the value of the lookup field for a fragment of the path, the string conversion of the base converter
+        return super().to_python(value)
+
+    def get_lookup_plan(self):
+        # built once per converter, when the converter is created, such that converting a value only constructs an object
+        klass = type(self)
+        plan = klass.__dict__.get('_lookup_plan')
+        if plan is None:
+            plan = klass._lookup_plan = LookupPlan.build(self.get_queryset(), self.field_name, getattr(self, 'check_field', True))
+        return plan
 
     def to_url(self, value):
         return super().to_url(getattr(value, self.field_name, value))
 
 
+class ModelLoadMixin(QuerySetLoadMixin):
+    name_prefix = 'eager_'
 
-class LazyLoadMixin:
-    model_class = None
-    field_name = None
+    def to_python(self, value):
+        value = self.to_key(value)
+        plan = self.get_lookup_plan()
+        queryset = plan.model_or_queryset
+        object_cache = get_object_cache()
+        if object_cache is not None:
+            result = object_cache.get(queryset, self.field_name, value)
+            if result is not None:
+                return result
+        negative_cache = get_negative_cache()
+        if negative_cache is not None and negative_cache.rejects(queryset, self.field_name, value):
+            raise Http404(f'No {self.model_class._meta.object_name} matches the given query.')
+        try:
+            result = pin_writes(get_object_or_404(read_queryset(queryset), Q((plan.pk_field, value))))
+        except Http404:
+            if negative_cache is not None:
+                negative_cache.add(queryset, self.field_name, value)
+            raise
+        if object_cache is not None:
+            object_cache.set(queryset, self.field_name, result)
+        return result
+
+    def load_bulk(self, keys):
+        # the objects of the keys, from the object cache or with one in_bulk query, like to_python for each key, the
+        # keys without an object are left out
+        plan = self.get_lookup_plan()
+        queryset = plan.model_or_queryset
+        object_cache, negative_cache = get_object_cache(), get_negative_cache()
+        found, pending = {}, set()
+        for key in set(keys):
+            obj = object_cache.get(queryset, self.field_name, key) if object_cache is not None else None
+            if obj is not None:
+                found[key] = obj
+            elif negative_cache is None or not negative_cache.rejects(queryset, self.field_name, key):
+                pending.add(key)
+        if pending:
+            loaded = read_queryset(queryset).in_bulk(pending, field_name=self.field_name)
+            for key in pending:
+                obj = pin_writes(loaded.get(key))
+                if obj is not None:
+                    found[key] = obj
+                    if object_cache is not None:
+                        object_cache.set(queryset, self.field_name, obj)
+                elif negative_cache is not None:
+                    negative_cache.add(queryset, self.field_name, key)
+        return found
+
+
+class LazyLoadMixin(QuerySetLoadMixin):
     check_field = True
 
-    @property
-    def accepts(self):
-        return (self.model_class,)
+    def to_python(self, value):
+        return ModelLazyObject.from_plan(self.get_lookup_plan(), self.to_key(value))
+
+
+class ModelListMixin(QuerySetLoadMixin):
+    """
+    A list of model objects, specified by their keys separated by commas, that is loaded with one query.
+    """
+    name_prefix = 'list_'
+    separator = ','
+    deduplicate = False
+    max_count = None
+    # the regex of one item, by default that of the base converter, or the one of item_regexes with the separator
+    item_regex = None
+    item_regexes = {StringConverter: '[^/{separator}]+'}
+    _base_regex = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.max_count is not None and cls.max_count < 1:
+            raise ValueError(f'The max_count of {cls.__name__} should be at least 1, not {cls.max_count}.')
+        separator = re.escape(cls.separator)
+        # the items are split on the separator, so these can not contain it
+        item_regex = cls.item_regex or cls.build_item_regex(separator)
+        if matches_containing(item_regex, cls.separator):
+            raise ValueError(f'The items of {cls.__name__} can contain the separator {cls.separator!r}.')
+        repeat = '*' if cls.max_count is None else f'{{0,{cls.max_count - 1}}}'
+        cls.regex = f'(?:{item_regex})(?:{separator}(?:{item_regex})){repeat}'
+        cls.to_types = (list,)
+        cls.from_types = (QuerySet, Manager, Iterable)
+
+    @classmethod
+    def build_item_regex(cls, separator):
+        # the regex of the base converter is kept, such that subclasses (with a different max_count) don't wrap the
+        # regex of the list twice
+        base_regex = cls._base_regex = cls._base_regex or strip_capture_groups(cls.regex)
+        for klass in cls.__mro__:
+            template = cls.item_regexes.get(klass)
+            if template is not None:
+                return template.format(separator=separator)
+        return base_regex
 
     def to_python(self, value):
-        return ModelLazyObject(self.model_class, super().to_python(value), pk_field=self.field_name, check_field=self.check_field)
+        to_key = self.to_key
+        keys = [to_key(part) for part in value.split(self.separator)]
+        if self.deduplicate:
+            keys = list(dict.fromkeys(keys))
+        if self.max_count is not None and len(keys) > self.max_count:
+            raise ValueError(f'At most {self.max_count} items are allowed.')
+        return ModelLazyList(self.get_queryset(), keys, pk_field=self.field_name)
 
     def to_url(self, value):
-        return super().to_url(getattr(value, self.field_name, value))
\ No newline at end of file
+        # use the keys of lazy lists, and of querysets that are not loaded yet, such that no objects are loaded
+        if isinstance(value, ModelLazyList):
+            value = value._keys
+        elif isinstance(value, Manager) or (isinstance(value, QuerySet) and value._result_cache is None):
+            value = value.values_list(self.field_name, flat=True)
+        to_url = super().to_url
+        return self.separator.join([to_url(item) for item in value])
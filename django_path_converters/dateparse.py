@@ -0,0 +1,129 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+# the same regexes as time.strptime uses for these directives, other directives are left to strptime
+DIRECTIVE_REGEXES = {
+    'd': r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])',
+    'H': r'(?P<H>2[0-3]|[0-1]\d|\d)',
+    'G': r'(?P<G>\d\d\d\d)',
+    'm': r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'M': r'(?P<M>[0-5]\d|\d)',
+    'S': r'(?P<S>6[0-1]|[0-5]\d|\d)',
+    'u': r'(?P<u>[1-7])',
+    'V': r'(?P<V>5[0-3]|0[1-9]|[1-4]\d|\d)',
+    'Y': r'(?P<Y>\d\d\d\d)',
+    'z': r'(?P<z>[+-]\d\d:?[0-5]\d(:?[0-5]\d(\.\d{1,6})?)?|(?-i:Z))',
+    '%': '%',
+}
+REGEX_CHARS = re.compile(r'([\\.^$*+?(){}\[\]|])')
+WHITESPACE = re.compile(r'\s+')
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def parse_timezone(z):
+    # the offset as parsed by strptime's %z
+    if z == 'Z':
+        return timezone.utc
+    original = z
+    if z[3] == ':':
+        z = z[:3] + z[4:]
+        if len(z) > 5:
+            if z[5] != ':':
+                raise ValueError(f'Inconsistent use of : in {original}')
+            z = z[:5] + z[6:]
+    gmtoff = int(z[1:3]) * 3600 + int(z[3:5]) * 60 + int(z[5:7] or 0)
+    fraction = int(z[8:].ljust(6, '0'))
+    if z[0] == '-':
+        gmtoff, fraction = -gmtoff, -fraction
+    return timezone(timedelta(seconds=gmtoff, microseconds=fraction))
+
+
+class FormatParser:
+    # parses a string like datetime.strptime does, with a regex compiled once per format
+
+    def __init__(self, format):
+        self.format = format
+        pattern = WHITESPACE.sub(r'\\s+', REGEX_CHARS.sub(r'\\\1', format))
+        directives = set()
+        parts = []
+        while '%' in pattern:
+            index = pattern.index('%')
+            directive = pattern[index + 1:index + 2]
+            if directive not in DIRECTIVE_REGEXES:
+                raise UnsupportedFormat(format)
+            parts += pattern[:index], DIRECTIVE_REGEXES[directive]
+            directives.add(directive)
+            pattern = pattern[index + 2:]
+        directives.discard('%')
+        self.iso = 'G' in directives
+        # other combinations need strptime's defaults and validation
+        if self.iso:
+            if not directives.issuperset('GVu') or directives.intersection('Ymd'):
+                raise UnsupportedFormat(format)
+        elif 'Y' not in directives or directives.intersection('Vu'):
+            raise UnsupportedFormat(format)
+        self.directives = directives
+        self.match = re.compile(''.join(parts) + pattern, re.IGNORECASE).match
+
+    def mismatch(self, value, found):
+        if found is None:
+            return ValueError(f'time data {value!r} does not match format {self.format!r}')
+        return ValueError(f'unconverted data remains: {value[found.end():]}')
+
+    def build(self, found):
+        group = found.group
+        directives = self.directives
+        if self.iso:
+            iso_year = int(group('G'))
+            correction = date(iso_year, 1, 4).isoweekday() + 3
+            result = date.fromordinal(date(iso_year, 1, 1).toordinal() - 1 + int(group('V')) * 7 + int(group('u')) - correction)
+            year, month, day = result.year, result.month, result.day
+        else:
+            year = int(group('Y'))
+            month = int(group('m')) if 'm' in directives else 1
+            day = int(group('d')) if 'd' in directives else 1
+        return datetime(
+            year, month, day,
+            int(group('H')) if 'H' in directives else 0,
+            int(group('M')) if 'M' in directives else 0,
+            int(group('S')) if 'S' in directives else 0,
+            0,
+            parse_timezone(group('z')) if 'z' in directives else None,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_format_parser(format):
+    try:
+        return FormatParser(format)
+    except UnsupportedFormat:
+        return None
+
+
+def parse_datetime(value, formats):
+    """
+    Parse the value with the first of the formats that fits, like datetime.strptime.
+
+    Formats with only %Y, %m, %d, %H, %M, %S and %z, or %G, %V and %u are matched in a single
+    pass without exceptions, other formats are passed to datetime.strptime.
+    """
+    if isinstance(formats, str):
+        formats = (formats,)
+    error = None
+    for format in formats:
+        parser = get_format_parser(format)
+        try:
+            if parser is None:
+                return datetime.strptime(value, format)
+            found = parser.match(value)
+            if found is None or found.end() != len(value):
+                error = parser.mismatch(value, found)
+                continue
+            return parser.build(found)
+        except ValueError as e:
+            error = e
+    raise error
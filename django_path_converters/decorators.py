@@ -1,49 +1,256 @@
 from functools import wraps
 import re
 
-from django.http import Http404
-from django.urls.converters import get_converter
-from django.utils.datastructures import MultiValueDict
-import re
+from asgiref.sync import iscoroutinefunction
+from django.db.models import Manager, QuerySet
+from django.http import Http404, QueryDict
+from django.urls.converters import get_converters
+from django.utils.functional import empty
+
+from django_path_converters.converters import LazyLoadMixin, ModelLoadMixin, NullConverterMixin
+from django_path_converters.lazymodelobject import BatchLoaderManager, ModelLazyObject
+from django_path_converters.utils import project_queryset
+
 
 def _get_converter(conv):
+    # the fullmatch of the compiled regex, and the converter instance
     if isinstance(conv, str):
-        conv = get_converter(conv)
-    return (re.compile(conv.regex), conv.to_python)
+        conv = get_converters()[conv]
+    elif isinstance(conv, type):
+        conv = conv()
+    return re.compile(conv.regex).fullmatch, conv
 
-def require_querydict(*, _required=(), **kwargs):
-    converters = {
-        k: _get_converter(v) for k, v in kwargs
-    }
-    def validate_convert(name, conv, vals):
-        if conv is None:
-            return vals
-        rgx, f = conv
-        result = []
-        for val in vals:
-            if rgx.fullmatch(val):
-                result.append(f(val))
-            else:
-                raise Http404(f'The query parameter ?{name}={val} does not satisfy the required pattern.')
+
+def compile_converters(converters):
+    return {name: _get_converter(conv) for name, conv in converters.items()}
+
+
+def _invalid(name, val):
+    return Http404(f'The query parameter ?{name}={val} does not satisfy the required pattern.')
+
+
+def validate_convert(name, conv, vals, manager=None):
+    fullmatch, converter = conv
+    for val in vals:
+        if not fullmatch(val):
+            raise _invalid(name, val)
+    if isinstance(converter, LazyLoadMixin) and (manager is not None or len(vals) > 1):
+        # the lazy objects are loaded together, with a single query per model and database
+        if manager is None:
+            manager = BatchLoaderManager()
+        result = [converter.to_python(val) for val in vals]
+        for obj in result:
+            if isinstance(obj, ModelLazyObject):
+                manager[obj._state.db].add(obj)
         return result
+    if len(vals) > 1 and isinstance(converter, ModelLoadMixin) and not isinstance(converter, NullConverterMixin):
+        # convert the values to the type of the field, and fetch the objects with (at most) one in_bulk query
+        keys = [converter.to_key(val) for val in vals]
+        objs = converter.load_bulk(keys)
+        for key, val in zip(keys, vals):
+            if key not in objs:
+                raise _invalid(name, val)
+        return [objs[key] for key in keys]
+    result = []
+    for val in vals:
+        try:
+            result.append(converter.to_python(val))
+        except ValueError:
+            raise _invalid(name, val)
+    return result
+
+
+class ConvertedQueryDict(QueryDict):
+    """
+    A QueryDict of the query parameters, where the values of the parameters with a converter are converted the first
+    time the parameter is accessed. The lazy model objects of all parameters share one BatchLoaderManager.
+
+    Copies keep the converters and the values that are already converted, urlencode uses the original strings. A
+    parameter that is changed is no longer converted.
+    """
+
+    def __init__(self, querydict, converters, mutable=False, manager=None):
+        super().__init__(mutable=True, encoding=getattr(querydict, 'encoding', None))
+        for key, values in querydict.lists():
+            dict.__setitem__(self, key, list(values))
+        self._converters = converters
+        self._pending = {key for key in self if key in converters}
+        # the original strings of the converted parameters
+        self._raw = {}
+        self._manager = manager or BatchLoaderManager()
+        self._mutable = mutable
+
+    def _convert(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+            raw = self._raw[key] = dict.__getitem__(self, key)
+            dict.__setitem__(self, key, validate_convert(key, self._converters[key], raw, self._manager))
+
+    def _forget(self, key):
+        # the parameter changes, so its values are the original strings again, and are no longer converted
+        self._pending.discard(key)
+        raw = self._raw.pop(key, None)
+        if raw is not None and key in self:
+            dict.__setitem__(self, key, list(raw))
+
+    def _strings(self):
+        # the lists of the original strings of all parameters
+        for key in self:
+            yield key, list(self._raw.get(key, dict.__getitem__(self, key)))
+
+    def __getitem__(self, key):
+        self._convert(key)
+        return super().__getitem__(key)
+
+    def _getlist(self, key, default=None, force_list=False):
+        self._convert(key)
+        return super()._getlist(key, default, force_list)
+
+    def __setitem__(self, key, value):
+        self._assert_mutable()
+        self._forget(key)
+        super().__setitem__(key, value)
+
+    def setlist(self, key, list_):
+        self._assert_mutable()
+        self._forget(key)
+        super().setlist(key, list_)
+
+    def setlistdefault(self, key, default_list=None):
+        self._assert_mutable()
+        self._forget(key)
+        return super().setlistdefault(key, default_list)
+
+    def __delitem__(self, key):
+        self._assert_mutable()
+        self._forget(key)
+        super().__delitem__(key)
+
+    def pop(self, key, *args):
+        self._assert_mutable()
+        self._convert(key)
+        self._raw.pop(key, None)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        self._assert_mutable()
+        for key in list(self._pending):
+            self._convert(key)
+        key, values = super().popitem()
+        self._raw.pop(key, None)
+        return key, values
+
+    def clear(self):
+        self._assert_mutable()
+        self._pending.clear()
+        self._raw.clear()
+        super().clear()
 
+    def lists(self):
+        for key in list(self._pending):
+            self._convert(key)
+        return super().lists()
+
+    def __copy__(self):
+        result = type(self)(QueryDict(), self._converters, mutable=True, manager=self._manager)
+        result.encoding = self.encoding
+        for key in self:
+            dict.__setitem__(result, key, list(dict.__getitem__(self, key)))
+        result._pending = set(self._pending)
+        result._raw = {key: list(raw) for key, raw in self._raw.items()}
+        return result
+
+    def __deepcopy__(self, memo):
+        # the converted objects are shared, like with copy
+        result = memo[id(self)] = self.__copy__()
+        return result
+
+    def copy(self):
+        return self.__copy__()
+
+    def urlencode(self, safe=None):
+        querydict = QueryDict(mutable=True, encoding=self.encoding)
+        for key, values in self._strings():
+            querydict.setlist(key, values)
+        return querydict.urlencode(safe)
+
+
+def check_querydict(querydict, required=(), converters=None):
+    # raise Http404 if a required parameter is missing, and wrap the querydict such that the values are converted
+    for req in required:
+        if req not in querydict:
+            raise Http404(f'The query string requires a ?{req}=… parameter.')
+    if converters:
+        return ConvertedQueryDict(querydict, converters)
+    return querydict
+
+
+def require_querydict(*, _required=(), **kwargs):
+    """
+    Require the given query parameters, and convert the values of the query parameters with a path converter, for
+    example:
+
+        @require_querydict(_required=('user',), user='auth.user', page='int')
+
+    The regexes are compiled once, the values are converted when the parameter is first accessed in request.GET.
+    """
+    converters = compile_converters(kwargs)
+
+    def wrapper(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapped(request, *args, **kwargs):
+                request.GET = check_querydict(request.GET, _required, converters)
+                return await func(request, *args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapped(request, *args, **kwargs):
+                request.GET = check_querydict(request.GET, _required, converters)
+                return func(request, *args, **kwargs)
+        return wrapped
+    return wrapper
+
+
+def converter_queryset(**querysets):
+    """
+    Load the lazy objects of the given view kwargs with a different queryset, for example:
+
+        @converter_queryset(article={'only': ('title',), 'select_related': ('author',)})
+
+    A dict is passed to project_queryset, a QuerySet or Manager is used as is.
+    """
     def wrapper(func):
-        @wraps(func)
-        def wrapped(request, *args, **kwargs):
-            data = request.GET
-            for req in _required:
-                if req not in data:
-                    raise Http404(f'The query string requires a ?{req}=… parameter.')
-            request.GET = MultiValueDict([
-                (k, validate_convert(k, converters.get(k), vs))
-                for k, vs in request.GET.lists()
-            ])
-            return func(*args, **kwargs)
+        cache = {}
+
+        def update(view_kwargs):
+            for name, queryset in querysets.items():
+                value = view_kwargs.get(name)
+                if isinstance(value, ModelLazyObject) and value._wrapped is empty:
+                    model = value._model
+                    key = name, model
+                    result = cache.get(key)
+                    if result is None:
+                        result = cache[key] = queryset if isinstance(queryset, (QuerySet, Manager)) else project_queryset(model, **queryset)
+                    value.with_queryset_update(result)
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapped(request, *args, **kwargs):
+                update(kwargs)
+                return await func(request, *args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapped(request, *args, **kwargs):
+                update(kwargs)
+                return func(request, *args, **kwargs)
         return wrapped
     return wrapper
 
 
 class RequireQueryStringMixin:
+    """
+    The counterpart of require_querydict for class-based views, the converters are compiled once per view class.
+    """
     querystring_required = ()
     querystring_converters = None
 
@@ -53,6 +260,13 @@ class RequireQueryStringMixin:
     def get_querystring_converters(self):
         return self.querystring_converters or {}
 
-    def setup(self, *args, **kwargs):
-        super().setup(*args, **kwargs)
-        # todo: rewrite request.GET
+    def get_querystring_plan(self):
+        klass = type(self)
+        plan = klass.__dict__.get('_querystring_plan')
+        if plan is None:
+            plan = klass._querystring_plan = compile_converters(self.get_querystring_converters())
+        return plan
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        request.GET = check_querydict(request.GET, self.get_querystring_required(), self.get_querystring_plan())
@@ -0,0 +1,338 @@
+import atexit
+import json
+import logging
+import os
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+from django_path_converters.signals import lazy_objects_measured
+
+INSTRUMENTATION_SETTING = 'PATH_CONVERTERS_INSTRUMENTATION'
+CONVERTER_STATS_SETTING = 'PATH_CONVERTERS_CONVERTER_STATS'
+HEADER = 'X-Path-Converters-Lazy-Objects'
+# the upper bounds of the latency buckets in microseconds, the last bucket counts the slower calls
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+logger = logging.getLogger(__name__)
+
+_request_stats = ContextVar('path_converters_request_stats', default=None)
+
+
+class LazyObjectStats:
+    """
+    What happened to the lazy model objects during one request.
+
+    The events are counted in total and per converter, the converter is identified by the
+    model and the lookup field, like `auth.user.username`:
+
+    * `created`: lazy objects that were constructed;
+    * `evaluated`: lazy objects that were loaded, either by accessing them or by awaiting them;
+    * `batched`: lazy objects that were filled in by a query of a `BatchLoader`;
+    * `cached`: lazy objects that were filled in from the object cache;
+    * `queried`: lazy objects that were loaded with a query of their own;
+    * `missing`: lazy objects for which no object exists;
+    * `state_proxies`: lazy `_state` objects that were constructed.
+    """
+
+    EVENTS = ('created', 'evaluated', 'batched', 'cached', 'queried', 'missing', 'state_proxies')
+
+    def __init__(self):
+        self.route = None
+        self.totals = Counter()
+        self.per_converter = {}
+        self.load_time = Counter()
+
+    @staticmethod
+    def converter_key(item):
+        return f'{item._model._meta.label_lower}.{item._pk_field}'
+
+    def record(self, event, item):
+        self.totals[event] += 1
+        key = self.converter_key(item)
+        counter = self.per_converter.get(key)
+        if counter is None:
+            counter = self.per_converter[key] = Counter()
+        counter[event] += 1
+
+    def record_load(self, item, duration):
+        self.record('evaluated', item)
+        self.load_time[self.converter_key(item)] += duration
+
+    @property
+    def total_load_time(self):
+        return sum(self.load_time.values())
+
+    def as_dict(self):
+        return {
+            'route': self.route,
+            **{event: self.totals[event] for event in self.EVENTS},
+            'load_time': self.total_load_time,
+            'converters': {
+                key: {**{event: counter[event] for event in self.EVENTS}, 'load_time': self.load_time[key]}
+                for key, counter in sorted(self.per_converter.items())
+            },
+        }
+
+    def header_value(self):
+        counts = '; '.join(f'{event}={self.totals[event]}' for event in self.EVENTS)
+        return f'{counts}; load-ms={self.total_load_time * 1000:.2f}'
+
+
+def get_request_stats():
+    # the stats of the current request, None if the instrumentation is not active
+    return _request_stats.get()
+
+
+def record(event, item):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(event, item)
+
+
+class timed_load:
+    # records the evaluation of a lazy object, and how long it took, if the instrumentation is active
+
+    __slots__ = ('item', 'stats', 'start')
+
+    def __init__(self, item):
+        self.item = item
+        self.stats = _request_stats.get()
+
+    def __enter__(self):
+        if self.stats is not None:
+            self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            self.stats.record_load(self.item, perf_counter() - self.start)
+
+
+_config = None
+_config_loaded = False
+
+
+def get_instrumentation_config():
+    # a dict with the (upper case) options, None if the instrumentation is disabled
+    global _config, _config_loaded
+    if not _config_loaded:
+        config = getattr(settings, INSTRUMENTATION_SETTING, None)
+        if config is True:
+            config = {}
+        if config is not None and config is not False:
+            _config = {'HEADERS': False, 'LOG_LEVEL': logging.DEBUG, **config}
+        else:
+            _config = None
+        _config_loaded = True
+    return _config
+
+
+def reset_instrumentation_config(*args, setting=None, **kwargs):
+    global _config, _config_loaded
+    if setting is None or setting == INSTRUMENTATION_SETTING:
+        _config = None
+        _config_loaded = False
+
+
+def start_request():
+    # returns the token to pass to finish_request, None if the instrumentation is disabled
+    if get_instrumentation_config() is not None:
+        return _request_stats.set(LazyObjectStats())
+
+
+def finish_request(token, sender, request, response):
+    if token is None:
+        return
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    config = get_instrumentation_config()
+    if stats is None or config is None:
+        return
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is not None:
+        stats.route = resolver_match.route
+    lazy_objects_measured.send(sender=sender, request=request, stats=stats)
+    if config['HEADERS'] and response is not None:
+        response[HEADER] = stats.header_value()
+        server_timing = f'lazy-objects;dur={stats.total_load_time * 1000:.2f}'
+        if response.has_header('Server-Timing'):
+            server_timing = f"{response['Server-Timing']}, {server_timing}"
+        response['Server-Timing'] = server_timing
+    level = config['LOG_LEVEL']
+    if isinstance(level, str):
+        level = logging.getLevelName(level)
+    if logger.isEnabledFor(level):
+        logger.log(level, 'Lazy objects of %s: %s', stats.route, stats.header_value(), extra={'path_converters': stats.as_dict()})
+
+
+class ConverterTiming:
+    # the calls of one method of one converter, ValueErrors are rejections, that let Django try the next pattern
+    __slots__ = ('calls', 'rejected', 'errors', 'total_time', 'histogram')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = self.rejected = self.errors = 0
+        self.total_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, duration):
+        if not self.calls:
+            register_export()
+        self.calls += 1
+        self.total_time += duration
+        self.histogram[bisect_left(LATENCY_BUCKETS, duration * 1e6)] += 1
+
+    def as_dict(self):
+        return {
+            'calls': self.calls, 'rejected': self.rejected, 'errors': self.errors,
+            'total_time': self.total_time, 'histogram': list(self.histogram),
+        }
+
+
+class ConverterStats:
+    """
+    The calls of to_python and to_url of the path converters in this process, per converter name.
+
+    Each method of each converter has a ConverterTiming, with the number of calls, the ValueErrors (rejected) and
+    other exceptions (errors), the total time, and a histogram of the latencies with the LATENCY_BUCKETS.
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    def timing(self, name, method):
+        timing = self.timings.get((name, method))
+        if timing is None:
+            timing = self.timings[name, method] = ConverterTiming()
+        return timing
+
+    def reset(self):
+        for timing in self.timings.values():
+            timing.reset()
+
+    def as_dict(self):
+        converters = {}
+        for (name, method), timing in sorted(self.timings.items()):
+            if timing.calls:
+                converters.setdefault(name, {})[method] = timing.as_dict()
+        return {'pid': os.getpid(), 'buckets': list(LATENCY_BUCKETS), 'converters': converters}
+
+
+_converter_stats = None
+_converter_stats_config = None
+_converter_stats_config_loaded = False
+_export_registered = False
+
+
+def get_converter_stats_config():
+    # a dict with the DUMP path and the SINK, None if the converter stats are disabled
+    global _converter_stats_config, _converter_stats_config_loaded
+    if not _converter_stats_config_loaded:
+        config = getattr(settings, CONVERTER_STATS_SETTING, None)
+        if config is True:
+            config = {}
+        if config is not None and config is not False:
+            _converter_stats_config = {'DUMP': None, 'SINK': None, **config}
+            dump = _converter_stats_config['DUMP']
+            if dump and '{pid}' not in dump:
+                # each process writes its own dump, otherwise the processes overwrite the stats of each other
+                raise ImproperlyConfigured(f"The DUMP of {CONVERTER_STATS_SETTING} should contain '{{pid}}', not {dump!r}.")
+        else:
+            _converter_stats_config = None
+        _converter_stats_config_loaded = True
+    return _converter_stats_config
+
+
+def get_converter_stats():
+    # the stats of this process, None if these are disabled
+    global _converter_stats
+    if not settings.configured or get_converter_stats_config() is None:
+        return None
+    if _converter_stats is None:
+        _converter_stats = ConverterStats()
+    return _converter_stats
+
+
+def register_export():
+    # the stats are exported when the process exits, once a converter is called, such that processes that convert
+    # nothing, like most management commands, do not write a dump
+    global _export_registered
+    if not _export_registered:
+        _export_registered = True
+        atexit.register(export_converter_stats)
+
+
+def timed_method(func, timing):
+    def timed(value):
+        start = perf_counter()
+        try:
+            result = func(value)
+        except ValueError:
+            timing.rejected += 1
+            raise
+        except Exception:
+            timing.errors += 1
+            raise
+        finally:
+            timing.record(perf_counter() - start)
+        return result
+    timed.__wrapped__ = func
+    return timed
+
+
+def instrument_converter(name, converter):
+    # times the calls of a registered converter instance, the instance is patched, such that the super() calls of the
+    # converter classes are not counted, and the disabled stats cost nothing
+    stats = get_converter_stats()
+    if stats is None or 'to_python' in vars(converter):
+        return
+    converter.to_python = timed_method(converter.to_python, stats.timing(name, 'to_python'))
+    converter.to_url = timed_method(converter.to_url, stats.timing(name, 'to_url'))
+
+
+def uninstrument_converter(converter):
+    vars(converter).pop('to_python', None)
+    vars(converter).pop('to_url', None)
+
+
+def install_converter_stats(*args, setting=None, **kwargs):
+    # (un)instruments all registered path converters, when the setting changes
+    if setting is not None and setting != CONVERTER_STATS_SETTING:
+        return
+    global _converter_stats_config, _converter_stats_config_loaded
+    _converter_stats_config = None
+    _converter_stats_config_loaded = False
+    from django.urls.converters import REGISTERED_CONVERTERS
+    from django_path_converters.converters import PathConverter
+    registered = set(PathConverter.registered)
+    for name, converter in REGISTERED_CONVERTERS.items():
+        if type(converter) in registered:
+            uninstrument_converter(converter)
+            instrument_converter(name, converter)
+
+
+def export_converter_stats():
+    # writes the stats to the DUMP file, and passes these to the SINK, a callable or the dotted path of one
+    config = get_converter_stats_config()
+    if _converter_stats is None or config is None:
+        return
+    data = _converter_stats.as_dict()
+    if config['DUMP']:
+        with open(config['DUMP'].format(pid=data['pid']), 'w') as f:
+            json.dump(data, f)
+    sink = config['SINK']
+    if sink:
+        (import_string(sink) if isinstance(sink, str) else sink)(data)
+    return data
+
+
+setting_changed.connect(reset_instrumentation_config)
+setting_changed.connect(install_converter_stats)
@@ -1,10 +1,23 @@
-from django.db.models import Model, QuerySet, Manager, Q
+import logging
+from collections import namedtuple
+from functools import lru_cache, reduce
+from operator import or_
+
+from django.db.models import F, Model, QuerySet, Manager, Q
 from django.db.models.base import ModelState
 from django.db.models.options import Options
+from django.db.models.signals import class_prepared
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils.functional import LazyObject, empty
 
-from django_path_converters.utils import get_model_options, get_model, get_queryset, get_model_or_queryset
+from django_path_converters.cache import get_negative_cache, get_object_cache
+from django_path_converters.instrumentation import record, timed_load
+from django_path_converters.routing import pin_writes, read_database, read_queryset
+from django_path_converters.signals import deferred_field_accessed
+from django_path_converters.utils import get_model_options, get_model, get_queryset, get_model_or_queryset, get_queryset_or_manager, get_unique_field, has_deferred_fields
+
+logger = logging.getLogger(__name__)
 
 
 class BatchLoaderManager:
@@ -30,7 +43,8 @@ class BatchLoader:
     def __init__(self, manager, db, *items):
         self.manager = manager
         self._db = db
-        self._items = {id(item): item for item in items}
+        self._items = {}
+        self.add(*items)
 
     @property
     def items(self):
@@ -39,39 +53,288 @@ class BatchLoader:
     def add(self, *values):
         for value in values:
             self._items[id(value)] = value
+            value._batcher = self
 
     def migrate(self, *values):
-        _values = self._values
+        # move items that now query a different database to the bucket of that database
+        _items = self._items
         _db = self._db
         for value in values:
-            pass
+            db = value._state.db
+            if db != _db:
+                _items.pop(id(value), None)
+                self.manager[db].add(value)
 
-    def _load(self):
-        db = None
+    def _can_load(self, item):
+        return not item._forked and get_unique_field(item._model, item._pk_field) is not None
+
+    def load(self, item):
+        if self._can_load(item):
+            self._load(item._model_or_queryset)
+
+    async def aload(self, item):
+        if self._can_load(item):
+            await self._aload(item._model_or_queryset)
+
+    def _lookups(self, model_or_queryset):
+        # group the pending items per lookup field, such that one query fetches all of them
+        lookups = {}
         for item in self._items.values():
             # possible that these are already fetched
             # we don't do forked querysets, since we assume that
             # was for good reasons
-            if item._wrapped is not empty and not item._forked:
-                pass
+            if item._model_or_queryset is model_or_queryset and item._wrapped is empty and not item._forked and not item._missing:
+                field = get_unique_field(item._model, item._pk_field)
+                if field is not None:
+                    pending = lookups.setdefault(item._pk_field, (field, {}))[1]
+                    pending.setdefault(field.to_python(item._pk), []).append(item)
+        return lookups
+
+    def _query(self, model_or_queryset, lookups):
+        queries = [Q((f'{pk_field}__in', list(pending))) for pk_field, (field, pending) in lookups.items() if pending]
+        if queries:
+            return get_queryset_or_manager(model_or_queryset, '_default_manager').using(self._db).filter(reduce(or_, queries))
+
+    @staticmethod
+    def _fill(lookups, obj):
+        # yields the lookup fields for which the object was pending
+        pin_writes(obj)
+        for pk_field, (field, pending) in lookups.items():
+            items = pending.pop(field.to_python(getattr(obj, field.attname)), ())
+            for item in items:
+                item._loaded(obj)
+                record('batched', item)
+            if items:
+                yield pk_field
+
+    @staticmethod
+    def _reject(model_or_queryset, lookups):
+        # the pending values that recently found no object are missing without a query
+        negative_cache = get_negative_cache()
+        if negative_cache is None:
+            return
+        for pk_field, (field, pending) in lookups.items():
+            for value in list(pending):
+                if negative_cache.rejects(model_or_queryset, pk_field, value):
+                    for item in pending.pop(value):
+                        item._missing = True
+                        record('missing', item)
+
+    @staticmethod
+    def _mark_missing(model_or_queryset, lookups):
+        negative_cache = get_negative_cache()
+        for pk_field, (field, pending) in lookups.items():
+            for value, items in pending.items():
+                if negative_cache is not None:
+                    negative_cache.add(model_or_queryset, pk_field, value)
+                for item in items:
+                    item._missing = True
+                    record('missing', item)
+
+    def _load(self, model_or_queryset):
+        lookups = self._lookups(model_or_queryset)
+        object_cache = get_object_cache()
+        if object_cache is not None:
+            for pk_field, (field, pending) in lookups.items():
+                for value in list(pending):
+                    obj = object_cache.get(model_or_queryset, pk_field, value)
+                    if obj is not None:
+                        for item in pending.pop(value):
+                            item._loaded(obj)
+                            record('cached', item)
+        self._reject(model_or_queryset, lookups)
+        queryset = self._query(model_or_queryset, lookups)
+        if queryset is None:
+            return
+        for obj in queryset:
+            for pk_field in self._fill(lookups, obj):
+                if object_cache is not None:
+                    object_cache.set(model_or_queryset, pk_field, obj)
+        self._mark_missing(model_or_queryset, lookups)
+
+    async def _aload(self, model_or_queryset):
+        lookups = self._lookups(model_or_queryset)
+        object_cache = get_object_cache()
+        if object_cache is not None:
+            for pk_field, (field, pending) in lookups.items():
+                for value in list(pending):
+                    obj = await object_cache.aget(model_or_queryset, pk_field, value)
+                    if obj is not None:
+                        for item in pending.pop(value):
+                            item._loaded(obj)
+                            record('cached', item)
+        self._reject(model_or_queryset, lookups)
+        queryset = self._query(model_or_queryset, lookups)
+        if queryset is None:
+            return
+        async for obj in queryset:
+            for pk_field in self._fill(lookups, obj):
+                if object_cache is not None:
+                    await object_cache.aset(model_or_queryset, pk_field, obj)
+        self._mark_missing(model_or_queryset, lookups)
+
+
+class JoinLoader:
+    """
+    Loads a lazy object and the lazy object that its foreign key points to with one query, with select_related.
+
+    If the query finds no row, one of the objects is missing or these are not related, and both are loaded by the
+    batch loader or with a query of their own, such that the result is the same as without the join.
+    """
+
+    def __init__(self, item, field, related):
+        self.item = item
+        self.field = field
+        self.related = related
+        self.done = False
+        item._join = self
+        related._join = self
+
+    def _queryset(self):
+        # None if the join is no longer useful, because an object is loaded, or uses a different queryset now
+        item, related = self.item, self.related
+        self.done = True
+        for value in (item, related):
+            if value._wrapped is not empty or value._missing or not isinstance(value._model_or_queryset, type):
+                return None
+        # the lookups are unique, so there is at most one row, and no need to order
+        return read_queryset(item._model_or_queryset).select_related(self.field.name).filter(
+            Q((item._pk_field, item._pk)), Q((f'{self.field.name}__{related._pk_field}', related._pk))
+        ).order_by()
+
+    def _fill(self, obj):
+        self.item._loaded(pin_writes(obj))
+        self.related._loaded(pin_writes(getattr(obj, self.field.name)))
+        record('batched', self.item)
+        record('batched', self.related)
+
+    def load(self):
+        if not self.done:
+            queryset = self._queryset()
+            if queryset is not None:
+                for obj in queryset:
+                    self._fill(obj)
+
+    async def aload(self):
+        if not self.done:
+            queryset = self._queryset()
+            if queryset is not None:
+                async for obj in queryset:
+                    self._fill(obj)
+
+
+def is_joinable(value):
+    return isinstance(value, ModelLazyObject) and value._wrapped is empty and value._join is None and not value._forked and isinstance(value._model_or_queryset, type)
+
+
+def uses_base_manager(model):
+    # select_related loads the related object with the base manager, so it would skip the filters of a default manager
+    default_manager, base_manager = model._default_manager, model._base_manager
+    return type(default_manager).get_queryset is type(base_manager).get_queryset and default_manager._queryset_class is base_manager._queryset_class
 
 
-class ModelLazyStateObject(LazyObject):
+def plan_joins(values):
+    """
+    Pairs the lazy objects where the model of one has exactly one foreign key (or one-to-one field) to the model
+    of the other, such that both are loaded with one query. Every lazy object is part of at most one join, and only
+    if the default manager of the related model does not filter or change its queryset.
+    """
+    values = [value for value in values if is_joinable(value)]
+    for item in values:
+        if item._join is not None:
+            continue
+        for related in values:
+            if related is item or related._join is not None or read_database(item._model_or_queryset) != read_database(related._model_or_queryset):
+                continue
+            fields = [
+                field for field in item._model._meta.concrete_fields
+                if (field.many_to_one or field.one_to_one) and field.related_model is related._model
+            ]
+            if len(fields) == 1 and uses_base_manager(related._model):
+                JoinLoader(item, fields[0], related)
+                break
+
+
+class SlotsLazyObject(LazyObject):
+    """
+    A LazyObject that keeps its own attributes in slots. These, and the attributes the subclasses define, are read
+    directly, without the proxying of LazyObject, the other attributes are those of the wrapped object.
+    """
+    __slots__ = ('_wrapped',)
+    # LazyObject checks this for every attribute it returns, it should not load a lazy object
+    _mask_wrapped = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._slot_names = frozenset(name for klass in cls.__mro__ for name in klass.__dict__.get('__slots__', ()))
+        cls._own_names = cls._slot_names | {
+            name
+            for klass in cls.__mro__[:cls.__mro__.index(SlotsLazyObject) + 1]
+            for name, value in klass.__dict__.items()
+            if getattr(value, '_mask_wrapped', True)
+        }
+
+    def __getattribute__(self, name):
+        if name in type(self)._own_names:
+            return object.__getattribute__(self, name)
+        return LazyObject.__getattribute__(self, name)
+
+    def __setattr__(self, name, value):
+        if name in type(self)._slot_names:
+            object.__setattr__(self, name, value)
+        else:
+            LazyObject.__setattr__(self, name, value)
+
+
+class LookupPlan(namedtuple('LookupPlan', ('model_or_queryset', 'model', 'pk_field', 'field', 'is_pk'))):
+    # everything a lazy object needs to know about its lookup, resolved once instead of for each object
+
+    @classmethod
+    def build(cls, model_or_queryset, pk_field='pk', check_field=True):
+        model_or_queryset = get_model_or_queryset(model_or_queryset)
+        model = get_model(model_or_queryset)
+        if check_field:
+            # check if the model indeed *can* resolve the field, will *NOT* make a query, an expression is not converted
+            # to the type of the field, and unlike __isnull, it can follow a lookup like slug__iexact
+            get_queryset(model_or_queryset).filter(Q((pk_field, F('pk'))))
+        is_pk = pk_field == 'pk' or pk_field == get_model_options(model).pk.name
+        return cls(model_or_queryset, model, pk_field, get_unique_field(model, pk_field), is_pk)
+
+
+@lru_cache(maxsize=None)
+def get_lookup_plan(model_or_queryset, pk_field='pk', check_field=True):
+    # for the models (and querysets) of the converters, these live as long as the process
+    return LookupPlan.build(model_or_queryset, pk_field, check_field)
+
+
+def clear_lookup_plans(*args, **kwargs):
+    get_lookup_plan.cache_clear()
+
+
+class_prepared.connect(clear_lookup_plans)
+
+
+class ModelLazyStateObject(SlotsLazyObject):
+    # the database is determined once, when it is first needed
+    __slots__ = ('_parent', '_db')
+
     def __init__(self, parent):
-        self.__dict__.update(_parent=parent, db=get_queryset(parent._model_or_queryset).db, _mask_wrapped=False)
+        self._parent = parent
+        self._db = None
         super().__init__()
+        record('state_proxies', parent)
 
     __class__ = ModelState
     adding = False
 
-    def __getattr__(self, name, *args, **kwargs):
-        if name == '_mask_wrapped':
-            return False
-        return super().__getattr__(name, *args, **kwargs)
-
     @property
     def db(self):
-        return self.__dict__['db']
+        if self._wrapped is not empty:
+            return self._wrapped.db
+        db = self._db
+        if db is None:
+            db = self._db = read_database(self._parent._model_or_queryset)
+        return db
 
     def _setup(self):
         # we can't use `self.parent._state`, since that will point us back to self
@@ -82,15 +345,11 @@ class ModelLazyStateObject(LazyObject):
         return result
 
 
-class ModelLazyObject(LazyObject):
-    # set class fields, to avoid infinite loops when setting attributes
-    _pk_field = 'pk'
-    _pk = None
-    _model_or_queryset = None
-    _model = None
-    _is_pk = True
-    _forked = False
-    _batcher = None
+class ModelLazyObject(SlotsLazyObject):
+    __slots__ = (
+        '_model_or_queryset', '_model', '_pk', '_pk_field', '_is_pk', '_forked', '_missing', '_batcher', '_join',
+        '_deferred', '_state_proxy', '_known_pk',
+    )
 
     @property
     def __class__(self):
@@ -108,56 +367,252 @@ class ModelLazyObject(LazyObject):
 
     def __init__(self, model_or_queryset, pk, pk_field='pk', check_field=True, batcher=None):
         assert isinstance(model_or_queryset, (type(Model), Model, Options, Manager, QuerySet))
-        # prevent loading the object by using a setter
-        dic = self.__dict__
-        model_or_queryset = get_model_or_queryset(model_or_queryset)
-        model = get_model(model_or_queryset)
-        dic.update(_model_or_queryset=model_or_queryset, _pk=pk, _model=model)
-        # prevent adding attributes to instances
-        if pk_field != 'pk':
-            dic.update(_pk_field=pk_field)
         if check_field:
-            # check if the model indeed *can* resolve the field, will *NOT* make a query
-            get_queryset(model_or_queryset).filter(Q((pk_field, pk)))
-        model_pk = get_model_options(model).pk.name
-        is_pk = pk_field == 'pk' or pk_field == model_pk
-        if not is_pk:
-            dic.update(_is_pk=False)
-        if is_pk:
-            dic.update(pk=pk)
-            dic[model_pk] = pk
-        else:
-            dic[pk_field] = pk
+            # check if the model indeed *can* resolve the field, and the key, will *NOT* make a query
+            get_queryset(get_model_or_queryset(model_or_queryset)).filter(Q((pk_field, pk)))
+        self._init(LookupPlan.build(model_or_queryset, pk_field, check_field=False), pk, batcher)
+
+    @classmethod
+    def from_plan(cls, plan, pk, batcher=None):
+        # a lazy object for a lookup that is already checked, like that of a converter
+        self = cls.__new__(cls)
+        self._init(plan, pk, batcher)
+        return self
+
+    def _init(self, plan, pk, batcher):
+        self._model_or_queryset = plan.model_or_queryset
+        self._model = plan.model
+        self._pk = pk
+        self._pk_field = plan.pk_field
+        self._is_pk = plan.is_pk
+        self._forked = self._missing = False
+        self._batcher = self._join = self._deferred = self._state_proxy = None
+        self._wrapped = empty
+        # the pk, as long as it is known without a query, and the object is not loaded
+        self._known_pk = pk if plan.is_pk else empty
+        record('created', self)
         if batcher is not None:
-            dic.update(_batcher=batcher)
-        super().__init__()
+            batcher.manager[self._state.db].add(self)
 
     def with_queryset(self, model_or_queryset=None):
         if model_or_queryset is not None:
             assert get_model(model_or_queryset) == self._model
         result = self._with_queryset_unsafe(model_or_queryset)
-        self.__dict__.update(_forked=True)
+        self._forked = True
         return result
 
     def _with_queryset_unsafe(self, model_or_queryset=None):
         return type(self)(model_or_queryset or self._model_or_queryset, self._pk, self._pk_field, batcher=self._batcher)
 
     def with_queryset_update(self, model_or_queryset=None):
-        self._model_or_queryset = model_or_queryset or self._model_or_queryset
+        if model_or_queryset is not None:
+            assert get_model(model_or_queryset) == self._model
+            self._model_or_queryset = get_model_or_queryset(model_or_queryset)
+            if self._state_proxy is not None:
+                self._state_proxy._db = None
+            if self._batcher is not None:
+                self._batcher.migrate(self)
         return self
 
     @property
     def _state(self):
-        return ModelLazyStateObject(self)
+        wrapped = self._wrapped
+        if wrapped is not empty:
+            return wrapped._state
+        state = self._state_proxy
+        if state is None:
+            state = self._state_proxy = ModelLazyStateObject(self)
+        return state
+
+    def __getattribute__(self, name):
+        if name == 'pk':
+            # read often, like for comparisons and hashes, so this takes as few lookups as possible
+            pk = object.__getattribute__(self, '_known_pk')
+            if pk is empty:
+                wrapped = object.__getattribute__(self, '_wrapped')
+                pk = (self._setup() if wrapped is empty else wrapped).pk
+            return pk
+        if name in type(self)._own_names:
+            return object.__getattribute__(self, name)
+        return LazyObject.__getattribute__(self, name)
 
     def __bool__(self):
         return True
 
-    def __getattr__(self, name, *args, **kwargs):
-        if name == '_state':
-            return ModelLazyStateObject(self)
-        return super().__getattr__(name, *args, **kwargs)
+    def __getattr__(self, name):
+        if self._wrapped is empty and (name == self._pk_field or (self._is_pk and name == self._model._meta.pk.name)):
+            # the key is known without a query
+            return self._pk
+        result = super().__getattr__(name)
+        if self._deferred:
+            self._report_deferred(name)
+        return result
+
+    def _loaded(self, obj):
+        # fills in the object, with the fields that are deferred before any of these is accessed
+        self._wrapped = obj
+        self._known_pk = empty
+        self._deferred = obj.get_deferred_fields() if has_deferred_fields(self._model_or_queryset) else None
+        return obj
+
+    def _report_deferred(self, name):
+        deferred = self._deferred
+        if name in deferred:
+            deferred.discard(name)
+            logger.info('Deferred field %s.%s of a lazy object was accessed.', self._model._meta.label, name)
+            deferred_field_accessed.send(sender=self._model, instance=self._wrapped, field_name=name)
+
+    def _not_found(self):
+        return Http404(f'No {get_model_options(self._model).object_name} matches the given query.')
+
+    def _setup(self):
+        with timed_load(self):
+            return self._load()
+
+    def _rejected(self):
+        # True if the lookup recently found no object, then there is no need to query again
+        negative_cache = get_negative_cache()
+        if negative_cache is not None and negative_cache.rejects(self._model_or_queryset, self._pk_field, self._pk):
+            self._missing = True
+            record('missing', self)
+            return True
+        return False
+
+    def _remember_missing(self):
+        record('missing', self)
+        negative_cache = get_negative_cache()
+        if negative_cache is not None:
+            negative_cache.add(self._model_or_queryset, self._pk_field, self._pk)
+
+    def _load(self):
+        if self._missing or self._rejected():
+            raise self._not_found()
+        object_cache = get_object_cache()
+        if object_cache is not None:
+            result = object_cache.get(self._model_or_queryset, self._pk_field, self._pk)
+            if result is not None:
+                self._loaded(result)
+                record('cached', self)
+                return result
+        if self._join is not None:
+            # fill in this object and the related object with one query
+            self._join.load()
+            if self._wrapped is not empty:
+                return self._wrapped
+        if self._batcher is not None:
+            # fill in this object, and all its pending siblings with one query
+            self._batcher.load(self)
+            if self._wrapped is not empty:
+                return self._wrapped
+            if self._missing:
+                raise self._not_found()
+        try:
+            result = self._loaded(pin_writes(get_object_or_404(read_queryset(self._model_or_queryset), Q((self._pk_field, self._pk)))))
+        except Http404:
+            self._remember_missing()
+            raise
+        record('queried', self)
+        if object_cache is not None:
+            object_cache.set(self._model_or_queryset, self._pk_field, result)
+        return result
+
+    async def aload(self):
+        # the async counterpart of _setup, returns the (loaded) wrapped object
+        if self._wrapped is not empty:
+            return self._wrapped
+        with timed_load(self):
+            return await self._aload()
+
+    async def _aload(self):
+        if self._missing or self._rejected():
+            raise self._not_found()
+        object_cache = get_object_cache()
+        if object_cache is not None:
+            result = await object_cache.aget(self._model_or_queryset, self._pk_field, self._pk)
+            if result is not None:
+                self._loaded(result)
+                record('cached', self)
+                return result
+        if self._join is not None:
+            await self._join.aload()
+            if self._wrapped is not empty:
+                return self._wrapped
+        if self._batcher is not None:
+            await self._batcher.aload(self)
+            if self._wrapped is not empty:
+                return self._wrapped
+        if self._missing:
+            raise self._not_found()
+        try:
+            result = pin_writes(await read_queryset(self._model_or_queryset).aget(Q((self._pk_field, self._pk))))
+        except self._model.DoesNotExist:
+            self._remember_missing()
+            raise self._not_found()
+        record('queried', self)
+        self._loaded(result)
+        if object_cache is not None:
+            await object_cache.aset(self._model_or_queryset, self._pk_field, result)
+        return result
+
+    def __await__(self):
+        return self.aload().__await__()
+
+
+class ModelLazyList(LazyObject):
+    """
+    A lazy list of the model objects with the given (unique) keys, in the order of the keys. All objects are loaded
+    with one in_bulk query when the list is first used, if one of the objects does not exist, Http404 is raised.
+    """
+    _model_or_queryset = None
+    _model = None
+    _pk_field = 'pk'
+    _keys = ()
+
+    @property
+    def __class__(self):
+        return list
+
+    def __init__(self, model_or_queryset, keys, pk_field='pk'):
+        model_or_queryset = get_model_or_queryset(model_or_queryset)
+        self.__dict__.update(_model_or_queryset=model_or_queryset, _model=get_model(model_or_queryset), _keys=tuple(keys), _pk_field=pk_field)
+        super().__init__()
+        record('created', self)
+
+    def __len__(self):
+        # known without a query
+        return len(self._keys)
+
+    def __bool__(self):
+        return bool(self._keys)
+
+    def _lookup(self):
+        # the field to pass to in_bulk, and the keys converted to the type of that field
+        field = get_unique_field(self._model, self._pk_field)
+        field_name = 'pk' if self._pk_field == 'pk' else field.name
+        return field_name, [field.to_python(key) for key in self._keys]
+
+    def _objects(self, keys, found):
+        if any(key not in found for key in keys):
+            record('missing', self)
+            raise Http404(f'No {get_model_options(self._model).object_name} matches the given query.')
+        record('queried', self)
+        return [pin_writes(found[key]) for key in keys]
 
     def _setup(self):
-        result = self._wrapped = get_object_or_404(self._model_or_queryset, Q((self._pk_field, self._pk)))
-        return result
\ No newline at end of file
+        with timed_load(self):
+            field_name, keys = self._lookup()
+            found = read_queryset(self._model_or_queryset).in_bulk(set(keys), field_name=field_name)
+            self._wrapped = result = self._objects(keys, found)
+            return result
+
+    async def aload(self):
+        if self._wrapped is not empty:
+            return self._wrapped
+        with timed_load(self):
+            field_name, keys = self._lookup()
+            found = await read_queryset(self._model_or_queryset).ain_bulk(set(keys), field_name=field_name)
+            self._wrapped = result = self._objects(keys, found)
+            return result
+
+    def __await__(self):
+        return self.aload().__await__()
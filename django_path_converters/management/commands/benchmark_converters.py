@@ -0,0 +1,198 @@
+import json
+import platform
+import re
+from contextlib import ExitStack
+from timeit import Timer
+
+import django
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import Http404
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, get_resolver, resolve, reverse as django_reverse
+from django.urls.converters import get_converters
+from django.urls.resolvers import RoutePattern
+
+from django_path_converters.converters import ModelListMixin, PathConverter
+from django_path_converters.lazymodelobject import ModelLazyObject
+from django_path_converters.middleware import QueryBatcherMiddleware
+from django_path_converters.regexes import optimize_regex
+from django_path_converters.registry import materialize_converters
+from django_path_converters.resolvers import get_trie_resolver
+from django_path_converters.reverse import reverse
+from django_path_converters.routing import finish_routing, start_routing
+from django_path_converters.utils import get_queryset
+
+PARAMETER = re.compile(r'<(?:(?P<converter>[^>:]+):)?(?P<parameter>[^>]+)>')
+# examples for the converters of Django itself, these do not define examples
+DEFAULT_EXAMPLES = {
+    'int': '1',
+    'str': 'example',
+    'slug': 'example-slug',
+    'uuid': '075194d3-6885-417e-a8a8-6c931e272f00',
+    'path': 'some/path',
+}
+
+
+def time_call(func, number, repeat):
+    # the best time of a single call in microseconds
+    return min(Timer(func).repeat(repeat=repeat, number=number)) * 1e6 / number
+
+
+def iter_routes(resolver, prefix=''):
+    # yields the full route and the URLPattern of all (nested) patterns that are defined with path()
+    for pattern in resolver.url_patterns:
+        if not isinstance(pattern.pattern, RoutePattern):
+            continue
+        route = f'{prefix}{pattern.pattern._route}'
+        if isinstance(pattern, URLPattern):
+            yield route, pattern
+        else:
+            yield from iter_routes(pattern, route)
+
+
+def converter_example(name, converter):
+    examples = getattr(converter, 'examples', None)
+    if examples:
+        return examples[0]
+    if hasattr(converter, 'get_queryset'):
+        # model converters have no examples, we use the first object in the database
+        obj = get_queryset(converter.get_queryset()).first()
+        if obj is None:
+            return None
+        return converter.to_url([obj] if isinstance(converter, ModelListMixin) else obj)
+    return DEFAULT_EXAMPLES.get(name)
+
+
+def example_path(route, converters):
+    # an example path for the route with the first example of each converter, None if there is no example
+    kwargs = {}
+    for found in PARAMETER.finditer(route):
+        name = found.group('converter') or 'str'
+        example = converter_example(name, converters.get(name))
+        if example is None:
+            return None, None
+        kwargs[found.group('parameter')] = example
+    return '/' + PARAMETER.sub(lambda found: kwargs[found.group('parameter')], route), kwargs
+
+
+def load_lazy_objects(path, match):
+    # loads the lazy objects like a GET request with the QueryBatcherMiddleware, so batched and joined
+    request = RequestFactory().get(path)
+    request.resolver_match = match
+    token = start_routing(request)
+    try:
+        QueryBatcherMiddleware(None).process_view(request, match.func, match.args, match.kwargs)
+        for value in (*match.args, *match.kwargs.values()):
+            if isinstance(value, ModelLazyObject):
+                try:
+                    value._setup()
+                except (Http404, ObjectDoesNotExist):
+                    # the example object does not exist, other errors are reported for the route
+                    pass
+    finally:
+        finish_routing(token)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the path converters and the resolving and reversing of the URL patterns"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=1000, help="Number of calls per measurement.")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of measurements, the best one is reported.")
+        parser.add_argument("--urlconf", help="The urlconf to benchmark, by default the ROOT_URLCONF.")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--baseline", help="Compare the results with those of an earlier --output file.")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="The relative slowdown that is flagged as a regression.")
+
+    def benchmark_converters(self, number, repeat):
+        results = {}
+        for klass in PathConverter.registered:
+            if not klass.examples:
+                continue
+            converter = klass()
+            # the regex as written, and as simplified by the PATH_CONVERTERS_OPTIMIZE_REGEXES pass
+            match, optimized_match = re.compile(klass.regex).fullmatch, re.compile(optimize_regex(klass.regex)).fullmatch
+            for example in klass.examples:
+                key = f'{klass.name}:{example}'
+                try:
+                    value = converter.to_python(example)
+                    results[key] = {
+                        'to_python': time_call(lambda: converter.to_python(example), number, repeat),
+                        'to_url': time_call(lambda: converter.to_url(value), number, repeat),
+                        'match': time_call(lambda: match(example), number, repeat),
+                        'optimized_match': time_call(lambda: optimized_match(example), number, repeat),
+                    }
+                except Exception as e:
+                    results[key] = {'error': repr(e)}
+        return results
+
+    def benchmark_routes(self, urlconf, number, repeat):
+        results = {}
+        converters = get_converters()
+        trie_resolver = get_trie_resolver(urlconf)
+        for route, pattern in iter_routes(get_resolver(urlconf)):
+            path, kwargs = example_path(route, converters)
+            if path is None or route in results:
+                continue
+            try:
+                with ExitStack() as stack:
+                    queries = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                    load_lazy_objects(path, resolve(path, urlconf))
+                result = results[route] = {
+                    'resolve': time_call(lambda: resolve(path, urlconf), number, repeat),
+                    'trie_resolve': time_call(lambda: trie_resolver.resolve(path), number, repeat),
+                    'queries': sum(map(len, queries)),
+                }
+                if pattern.name:
+                    result['reverse'] = time_call(lambda: django_reverse(pattern.name, urlconf, kwargs=kwargs), number, repeat)
+                    result['fast_reverse'] = time_call(lambda: reverse(pattern.name, urlconf, kwargs=kwargs), number, repeat)
+            except Exception as e:
+                results[route] = {'error': repr(e)}
+        return results
+
+    def compare(self, results, baseline, tolerance):
+        # yields a description of each measurement that got slower, or makes more queries
+        for section, items in results.items():
+            for key, metrics in items.items():
+                old_metrics = baseline.get(section, {}).get(key, {})
+                for metric, value in metrics.items():
+                    old = old_metrics.get(metric)
+                    if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                        continue
+                    if metric == 'queries':
+                        if value > old:
+                            yield f'{section} {key} {metric}: {old} -> {value}'
+                    elif value > old * (1 + tolerance):
+                        yield f'{section} {key} {metric}: {old:.2f} -> {value:.2f} us'
+
+    def handle(self, *args, number=1000, repeat=5, urlconf=None, output=None, baseline=None, tolerance=0.2, **options):
+        materialize_converters()
+        results = {
+            'converters': self.benchmark_converters(number, repeat),
+            'routes': self.benchmark_routes(urlconf, number, repeat),
+        }
+        for section, items in results.items():
+            for key, metrics in items.items():
+                measured = ', '.join(
+                    f'{metric}={value:.2f} us' if isinstance(value, float) else f'{metric}={value}'
+                    for metric, value in metrics.items()
+                )
+                self.stdout.write(f'{section:<10} {key:<60} {measured}')
+        if output:
+            with open(output, 'w') as f:
+                json.dump({
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'number': number,
+                    **results,
+                }, f, indent=2)
+        if baseline:
+            with open(baseline) as f:
+                regressions = list(self.compare(results, json.load(f), tolerance))
+            for regression in regressions:
+                self.stderr.write(f'[\x1b[31m✗\x1b[0m] {regression}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) compared to {baseline}')
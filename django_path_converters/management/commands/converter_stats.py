@@ -0,0 +1,90 @@
+import json
+from glob import glob
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_path_converters.instrumentation import CONVERTER_STATS_SETTING, get_converter_stats_config
+
+COLUMNS = ('calls', 'rejected', 'errors', 'total_ms', 'mean_us', 'p50_us', 'p95_us', 'p99_us')
+
+
+def merge_stats(dumps):
+    # sums the stats of several processes, per converter and method
+    buckets = None
+    merged = {}
+    for data in dumps:
+        if buckets is None:
+            buckets = data['buckets']
+        elif buckets != data['buckets']:
+            raise CommandError('The dumps use different latency buckets.')
+        for name, methods in data['converters'].items():
+            for method, timing in methods.items():
+                total = merged.setdefault((name, method), {'calls': 0, 'rejected': 0, 'errors': 0, 'total_time': 0.0, 'histogram': [0] * len(timing['histogram'])})
+                for key in ('calls', 'rejected', 'errors', 'total_time'):
+                    total[key] += timing[key]
+                total['histogram'] = [a + b for a, b in zip(total['histogram'], timing['histogram'])]
+    return buckets or [], merged
+
+
+def percentile(buckets, histogram, fraction):
+    # the upper bound in microseconds of the bucket that contains the fraction of the calls, None for the last bucket
+    target = fraction * sum(histogram)
+    seen = 0
+    for bound, count in zip((*buckets, None), histogram):
+        seen += count
+        if seen >= target:
+            return bound
+
+
+def summarize(buckets, timing):
+    calls = timing['calls']
+    return {
+        'calls': calls,
+        'rejected': timing['rejected'],
+        'errors': timing['errors'],
+        'total_ms': timing['total_time'] * 1e3,
+        'mean_us': timing['total_time'] * 1e6 / calls if calls else 0.0,
+        **{f'p{q}_us': percentile(buckets, timing['histogram'], q / 100) for q in (50, 95, 99)},
+    }
+
+
+class Command(BaseCommand):
+    help = "Print the calls of the path converters per converter, as measured with PATH_CONVERTERS_CONVERTER_STATS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dumps", nargs="*", help="The dump files to aggregate, by default those of all processes of the DUMP setting.")
+        parser.add_argument("--sort", choices=COLUMNS, default='total_ms', help="The column to sort on, descending.")
+        parser.add_argument("--limit", type=int, help="Only print the first rows.")
+        parser.add_argument("--output", help="Write the aggregated rows as JSON to this file.")
+
+    def handle(self, *args, dumps=(), sort='total_ms', limit=None, output=None, **options):
+        if not dumps:
+            config = get_converter_stats_config() or {}
+            if not config.get('DUMP'):
+                raise CommandError(f'Pass the dump files, or set the DUMP of {CONVERTER_STATS_SETTING}.')
+            dumps = sorted(glob(config['DUMP'].format(pid='*')))
+        data = []
+        for path in dumps:
+            with open(path) as f:
+                data.append(json.load(f))
+        buckets, merged = merge_stats(data)
+        rows = [{'converter': name, 'method': method, **summarize(buckets, timing)} for (name, method), timing in merged.items()]
+        # the last bucket has no upper bound, so it sorts after all others
+        rows.sort(key=lambda row: float('inf') if row[sort] is None else row[sort], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        self.stdout.write(f"{'converter':<40} {'method':<10} " + ' '.join(f'{column:>10}' for column in COLUMNS))
+        for row in rows:
+            cells = []
+            for column in COLUMNS:
+                value = row[column]
+                if value is None:
+                    cells.append(f'{">" + str(buckets[-1]):>10}')
+                elif isinstance(value, float):
+                    cells.append(f'{value:>10.2f}')
+                else:
+                    cells.append(f'{value:>10}')
+            self.stdout.write(f"{row['converter']:<40} {row['method']:<10} " + ' '.join(cells))
+        if output:
+            with open(output, 'w') as f:
+                json.dump(rows, f, indent=2)
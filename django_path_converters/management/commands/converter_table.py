@@ -6,6 +6,7 @@ import pandas as pd
 from django.utils.html import escape
 from functools import partial
 from types import GenericAlias
+from django_path_converters.registry import materialize_converters
 
 
 def str_type(typ):
@@ -47,6 +48,7 @@ class Command(BaseCommand):
     help = "Create a table of the registered path converters"
 
     def handle(self, *args, **options):
+        materialize_converters()
         df = pd.DataFrame([klass.data_dict() for klass in PathConverter.registered]).sort_values('name')
 
         # df.rename(inplace=True)
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from tabulate import tabulate
 
 from django_path_converters.converters import PathConverter
+from django_path_converters.registry import materialize_converters
 
 
 def summarize_converters(*path_converters):
@@ -14,5 +15,6 @@ class Command(BaseCommand):
     help = "List all path converters"
 
     def handle(self, *args, **options):
+        materialize_converters()
         converters = [klass.data_dict() for klass in PathConverter.registered]
         return print(summarize_converters(*converters))
\ No newline at end of file
@@ -2,12 +2,14 @@ from operator import itemgetter
 
 from django.core.management.base import BaseCommand
 from django.urls.converters import get_converters
+from django_path_converters.registry import materialize_converters
 
 
 class Command(BaseCommand):
     help = "Search and list path converters"
 
     def handle(self, *args, **options):
+        materialize_converters()
         items = sorted(get_converters().items(), key=itemgetter(0))
         lenk = max(map(len, map(itemgetter(0), items))) + 5
         for key, val in items:
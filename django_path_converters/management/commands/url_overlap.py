@@ -1,25 +1,249 @@
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import md5
+from importlib.metadata import version
+from io import BytesIO
 from itertools import islice
 
 from django.core.management.base import BaseCommand
 from django.urls import get_resolver
-from functools import reduce
+from functools import lru_cache, reduce
 from operator import or_
-from greenery import parse as gparse
 from interegular import parse_pattern
+from interegular.fsm import anything_else
 
-from xeger import Xeger
-from random import randint
+from random import Random, randint
+import copyreg
+import os
+import pickle
+import string
 import sys
 import re
 from argparse import BooleanOptionalAction
 from django_path_converters.utils import strip_capture_groups
 
+# bump if the cached FSMs or verdicts change meaning
+CACHE_FORMAT = 1
+EXAMPLE_CHARS = frozenset(string.printable.strip())
 ALL = parse_pattern('[\W\w]*').to_fsm().reduce()
 NONE = parse_pattern('[]').to_fsm().reduce()
 
+class FSMPickler(pickle.Pickler):
+    # the FSMs are pickled for the worker processes and the cache, the anything_else sentinel is pickled by name, such
+    # that pickle.load(s) returns the same object, without changing how other picklers handle it
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[type(anything_else)] = lambda sentinel: 'anything_else'
+
+
+def dumps_fsms(obj):
+    f = BytesIO()
+    FSMPickler(f, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return f.getvalue()
+
+
 def parse_regex_to_fsm(value):
     return parse_pattern(value).to_fsm().reduce()
 
+
+@lru_cache(maxsize=None)
+def parse_url_regex(regex):
+    return parse_regex_to_fsm(strip_capture_groups(regex))
+
+
+def symbol_order(symbol):
+    return symbol is anything_else, str(symbol)
+
+
+def shortest_example(fsm, rng):
+    # one of the shortest strings accepted by the fsm, with a random (printable) character for each transition,
+    # the states are visited in the order of their characters, such that the numbering of the states does not matter
+    by_transition = fsm.alphabet.by_transition
+    parents = {fsm.initial: None}
+    queue = deque([fsm.initial])
+    while queue:
+        state = queue.popleft()
+        if state in fsm.finals:
+            break
+        next_states = {}
+        for transition, next_state in fsm.map.get(state, {}).items():
+            next_states.setdefault(next_state, set()).update(by_transition[transition])
+        for next_state, symbols in sorted(next_states.items(), key=lambda item: min(map(symbol_order, item[1]))):
+            if next_state not in parents:
+                parents[next_state] = state, symbols
+                queue.append(next_state)
+    else:
+        return None
+    steps = []
+    while parents[state] is not None:
+        state, symbols = parents[state]
+        steps.append(symbols)
+    known = set(fsm.alphabet.keys())
+    chars = []
+    for symbols in reversed(steps):
+        symbols = set(symbols)
+        if anything_else in symbols:
+            symbols.discard(anything_else)
+            symbols.update(EXAMPLE_CHARS - known)
+        printable = symbols & EXAMPLE_CHARS
+        chars.append(rng.choice(sorted(printable or symbols)))
+    return ''.join(chars)
+
+
+def literal_prefix(fsm):
+    # the string with which every string accepted by the fsm starts
+    chars = []
+    state = fsm.initial
+    by_transition = fsm.alphabet.by_transition
+    while state not in fsm.finals:
+        transitions = fsm.map.get(state, {})
+        if len(transitions) != 1:
+            break
+        (transition, state), = transitions.items()
+        symbols = by_transition[transition]
+        if len(symbols) != 1 or symbols[0] is anything_else:
+            break
+        chars.append(symbols[0])
+    return ''.join(chars)
+
+
+def can_start_with(fsm, text):
+    # False if the fsm does not accept any string that starts with the text
+    state = fsm.initial
+    alphabet = fsm.alphabet
+    for char in text:
+        state = fsm.map.get(state, {}).get(alphabet[char])
+        if state is None:
+            return False
+    return True
+
+
+def candidate_pairs(fsms):
+    """
+    The pairs (i, j) with i < j of patterns that might overlap.
+
+    Two patterns can only overlap if the literal prefix of one is a prefix of the literal prefix of the other, and
+    the pattern with the shortest prefix can read the longest prefix. Sorting the prefixes puts all patterns with a
+    longer prefix right after the pattern, so we do not have to look at all pairs.
+    """
+    prefixes = [literal_prefix(fsm) for fsm in fsms]
+    order = sorted(range(len(fsms)), key=prefixes.__getitem__)
+    pairs = []
+    for k, i in enumerate(order):
+        prefix = prefixes[i]
+        for j in islice(order, k + 1, None):
+            if not prefixes[j].startswith(prefix):
+                break
+            if can_start_with(fsms[i], prefixes[j]):
+                pairs.append((i, j) if i < j else (j, i))
+    pairs.sort()
+    return pairs
+
+
+def compare_patterns(task):
+    """
+    Runs in a worker process: the verdict of two patterns, and how these overlap.
+
+    The verdict is None if the patterns do not overlap, and (full_overlap, reorder) otherwise. A verdict of an
+    earlier run can be passed, then only the example is generated.
+    """
+    i, j, full1, full2, regex1, regex2, seed, verdict = task
+    intersect = regex1 & regex2
+    if verdict is None:
+        if intersect.empty():
+            return None, None
+        verdict = (regex1 ^ regex2).empty(), False
+        if not verdict[0]:
+            verdict = False, (regex2 - regex1).empty()
+    full_overlap, reorder = verdict
+    # a generator per pair of patterns, such that the example does not depend on the workers or the cache
+    example = shortest_example(intersect, Random(f'{seed}:{full1}:{full2}'))  # shorter URLs, make the problem clearer
+    captures = None
+    if example is not None:
+        capture1 = re.match(full1, example)
+        capture2 = re.match(full2, example)
+        if capture1 and capture2:
+            captures = capture1.groupdict(), capture2.groupdict()
+    return verdict, (i, j, full_overlap, reorder, example, captures)
+
+
+def compare_pickled(data):
+    # the task as pickled by the FSMPickler, the executor would pickle the FSMs with its own pickler
+    return compare_patterns(pickle.loads(data))
+
+
+def pattern_key(regex):
+    return md5(regex.encode(), usedforsecurity=False).hexdigest()
+
+
+class OverlapCache:
+    """
+    The reduced FSMs of the patterns, and the verdicts of pairs of patterns of earlier runs.
+
+    Everything is keyed by a hash of the pattern regexes, and stored in a pickle file together with the versions of
+    the libraries, the file is ignored if these versions differ. Only the entries of the patterns of the last run
+    are kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = f'{CACHE_FORMAT}:{version("interegular")}:{sys.version_info[0]}.{sys.version_info[1]}'
+        self.fsms = {}
+        self.verdicts = {}
+        self.used_fsms = {}
+        self.used_verdicts = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if data.get('version') == self.version:
+            self.fsms = data['fsms']
+            self.verdicts = data['verdicts']
+
+    def save(self):
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            FSMPickler(f, pickle.HIGHEST_PROTOCOL).dump({'version': self.version, 'fsms': self.used_fsms, 'verdicts': self.used_verdicts})
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def get_fsm(self, regex):
+        key = pattern_key(regex)
+        fsm = self.fsms.get(key)
+        if fsm is None:
+            self.misses['patterns'] += 1
+            fsm = parse_url_regex(regex)
+        else:
+            self.hits['patterns'] += 1
+        self.used_fsms[key] = fsm
+        return fsm
+
+    def get_verdict(self, full1, full2):
+        # a tuple with the verdict, or None if the pair was not compared before
+        key = pattern_key(full1), pattern_key(full2)
+        if key in self.verdicts:
+            self.hits['pairs'] += 1
+            verdict = self.verdicts[key]
+            self.used_verdicts[key] = verdict
+            return verdict,
+        self.misses['pairs'] += 1
+
+    def set_verdict(self, full1, full2, verdict):
+        self.used_verdicts[pattern_key(full1), pattern_key(full2)] = verdict
+
+    def report(self):
+        return ', '.join(
+            f'{self.hits[kind]}/{self.hits[kind] + self.misses[kind]} {kind}'
+            for kind in ('patterns', 'pairs')
+        )
+
 class Command(BaseCommand):
     help = "Search if two or more URLs overlap. The exit code shows the number of overlaps."
 
@@ -29,8 +253,11 @@ class Command(BaseCommand):
         parser.add_argument("--verbose", action=BooleanOptionalAction)
         parser.add_argument("--accept", type=parse_regex_to_fsm, default=(ALL,), nargs='*')
         parser.add_argument("--reject", type=parse_regex_to_fsm, default=(NONE,), nargs='*')
+        parser.add_argument("--jobs", type=int, help="Number of processes to compare the patterns, by default the number of CPUs.")
+        parser.add_argument("--cache", help="File to cache the FSMs and the verdicts of pairs of patterns between runs.")
+        parser.add_argument("--clear-cache", action='store_true', help="Remove the cache file first.")
 
-    def produce_regexes(self, resolver, prefix, regex_filter=ALL):
+    def produce_regexes(self, resolver, prefix, regex_filter=ALL, cache=None):
         subregex = resolver.pattern.regex.pattern
         if subregex.startswith('^'):
             subregex = subregex[1:]
@@ -40,11 +267,11 @@ class Command(BaseCommand):
             subregex = subregex[:-2]
         regex = f'{prefix}{subregex}'
         if resolver.callback is not None:
-            result = parse_pattern(strip_capture_groups(regex)).to_fsm().reduce()
+            result = parse_url_regex(regex) if cache is None else cache.get_fsm(regex)
             if not (regex_filter & result).empty():
-                yield regex, [result, 0]
+                yield regex, result
         for subresolver in getattr(resolver, 'url_patterns', ()):
-            yield from self.produce_regexes(subresolver, regex, regex_filter=regex_filter)
+            yield from self.produce_regexes(subresolver, regex, regex_filter=regex_filter, cache=cache)
 
     def explain_capture(self, capture_dict, _type='first', _hasnext=False):
         if capture_dict:
@@ -52,62 +279,73 @@ class Command(BaseCommand):
             sys.stderr.write(f'        with {explain} for the {_type} pattern{"; and" if _hasnext else "."}\n')
             return True
 
-    def explain_failure(self, xeger, regex1, regex2, full1, full2):
-        intersect = (regex1 & regex2).reduce()
-        fail = not intersect.empty()
-        reorder = False
-        if fail:
-            full_overlap = ''
-            if (regex1 ^ regex2).empty():
-                full_overlap = '\x1b[1mfully\x1b[0m '
-            else:
-                reorder = (regex2 - regex1).empty()
-            with_example = False
-            example = None
-            try:
-                overlap = str(gparse(strip_capture_groups(full1)) & gparse(strip_capture_groups(full2)))
-                example = xeger.xeger(overlap)
-                capture1 = re.match(full1, example)
-                capture2 = re.match(full2, example)
-                with_example = capture1 and capture2
-            except:
-                pass
-            sys.stderr.write(f'[\x1b[31m✗\x1b[0m] patterns \x1b[34m{full1}\x1b[0m and \x1b[34m{full2}\x1b[0m {full_overlap}overlap\n')
-            if with_example:
-                sys.stderr.write(f'      for example with \x1b[35m{example!r}\x1b[0m\n')
-                groupdict1 = capture1.groupdict()
-                groupdict2 = capture2.groupdict()
-                self.explain_capture(groupdict1, _hasnext=groupdict2)
-                self.explain_capture(groupdict2, _type='second')
-            if reorder:
-                sys.stderr.write(f'    \x1b[33;40m!\x1b[0m since all captures by the second pattern are also captured by the first pattern,\n')
-                sys.stderr.write(f'      the second pattern will never fire, you therefore probably should reorder the patterns.\n')
-            sys.stderr.write(f'\n')
-        return fail, reorder
+    def explain_failure(self, full1, full2, full_overlap, reorder, example, captures):
+        full_overlap = '\x1b[1mfully\x1b[0m ' if full_overlap else ''
+        sys.stderr.write(f'[\x1b[31m✗\x1b[0m] patterns \x1b[34m{full1}\x1b[0m and \x1b[34m{full2}\x1b[0m {full_overlap}overlap\n')
+        if captures:
+            sys.stderr.write(f'      for example with \x1b[35m{example!r}\x1b[0m\n')
+            groupdict1, groupdict2 = captures
+            self.explain_capture(groupdict1, _hasnext=groupdict2)
+            self.explain_capture(groupdict2, _type='second')
+        if reorder:
+            sys.stderr.write(f'    \x1b[33;40m!\x1b[0m since all captures by the second pattern are also captured by the first pattern,\n')
+            sys.stderr.write(f'      the second pattern will never fire, you therefore probably should reorder the patterns.\n')
+        sys.stderr.write(f'\n')
 
+    def compare_all(self, regexes, seed, jobs=None, cache=None):
+        # the overlaps of the candidate pairs, in the order of the patterns
+        tasks = []
+        for i, j in candidate_pairs([fsm for _, fsm in regexes]):
+            (full1, regex1), (full2, regex2) = regexes[i], regexes[j]
+            verdict = None
+            if cache is not None:
+                cached = cache.get_verdict(full1, full2)
+                if cached is not None:
+                    verdict, = cached
+                    if verdict is None:
+                        continue
+            tasks.append((i, j, full1, full2, regex1, regex2, seed, verdict))
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(jobs) as executor:
+                results = list(executor.map(compare_pickled, map(dumps_fsms, tasks), chunksize=max(1, len(tasks) // (4 * jobs))))
+        else:
+            results = list(map(compare_patterns, tasks))
+        overlaps = []
+        for task, (verdict, overlap) in zip(tasks, results):
+            if cache is not None:
+                cache.set_verdict(task[2], task[3], verdict)
+            if overlap is not None:
+                overlaps.append(overlap)
+        return overlaps
 
-    def handle(self, *args, seed=None, verbose=False, accept=(ALL,), reject=(NONE,), **options):
+    def handle(self, *args, seed=None, verbose=False, accept=(ALL,), reject=(NONE,), jobs=None, cache=None, clear_cache=False, **options):
         resolver = get_resolver()
         regex_filter = (reduce(or_, accept) - reduce(or_, reject)).reduce()
-        regexes = list(self.produce_regexes(resolver, '', regex_filter=regex_filter))
-        fail = 0
+        if cache is not None:
+            cache = OverlapCache(cache)
+            if clear_cache:
+                cache.clear()
+            cache.load()
+        regexes = list(self.produce_regexes(resolver, '', regex_filter=regex_filter, cache=cache))
         if seed is None:
             seed = randint(0, 2**64)
-        xeger = Xeger(limit=1, seed=seed)  # shorter URLs, make the problem clearer
 
-        nooverlaps = []
+        failures = [0] * len(regexes)
         reorders = {}
-        for i, (full1, [regex1, subfail]) in enumerate(regexes, 1):
-            for full2, regex2all in islice(regexes, i, None):
-                regex2 = regex2all[0]
-                hasfailed, to_reorder = self.explain_failure(xeger, regex1, regex2, full1, full2)
-                if to_reorder:
-                    reorders.setdefault(full2, full1)
-                subfail += hasfailed
-                regex2all[1] += hasfailed
-            if verbose and not subfail:
-                nooverlaps.append(full1)
-            fail += subfail
+        for i, j, full_overlap, reorder, example, captures in self.compare_all(regexes, seed, jobs, cache):
+            full1, full2 = regexes[i][0], regexes[j][0]
+            self.explain_failure(full1, full2, full_overlap, reorder, example, captures)
+            if reorder:
+                reorders.setdefault(full2, full1)
+            failures[i] += 1
+            failures[j] += 1
+        if cache is not None:
+            cache.save()
+            sys.stdout.write(f'cache hits: {cache.report()}\n')
+        fail = sum(failures)
+        nooverlaps = [full for (full, _), failed in zip(regexes, failures) if verbose and not failed]
 
         if reorders:
             sys.stderr.write('The following reorders are very advisable (otherwise unreachable):\n')
@@ -121,7 +359,7 @@ class Command(BaseCommand):
                 sys.stdout.write(f'patterns with no overlap found†: \n')
                 for nooverlap in nooverlaps:
                     sys.stdout.write(f'  [\x1b[32m✓\x1b[0m] \x1b[34m{nooverlap}\x1b[0m\n')
-                sys.stdout.write(f'† beware that not for every overlap, an example can be found, since greenery is a bit limited.')
+                sys.stdout.write(f'† beware that not for every overlap, an example can be found.')
             sys.stdout.write(f'\n')
             sys.stdout.write(f'The examples are derived from a generator with seed \x1b[36m{seed}\x1b[0m.\n')
         status = fail // 2 + len(reorders)
@@ -1,22 +1,62 @@
-from collections import defaultdict
-from django_path_converters.lazymodelobject import ModelLazyObject, BatchLoader, BatchLoaderManager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import empty
+
+from django_path_converters.instrumentation import finish_request, start_request
+from django_path_converters.lazymodelobject import ModelLazyObject, BatchLoaderManager, plan_joins
+from django_path_converters.routing import finish_routing, route_database, start_routing
 
 class QueryBatcherMiddleware:
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, _get_response):
         self._get_response = _get_response
+        if iscoroutinefunction(_get_response):
+            markcoroutinefunction(self)
+            # the handler checks process_view itself, this avoids a thread hop per request
+            self.process_view = self.aprocess_view
 
     def process_view(self, request, view_func, view_args, view_kwargs):
-        batches = defaultdict(list)
-        for parameter in (*view_args, *view_kwargs.values()):
-            if isinstance(parameter, ModelLazyObject):
-                batches[parameter._state.db].append(parameter)
-        if batches:
-            manager = BatchLoaderManager()
-            for db, batch in batches.items():
-                batcher = manager[db] = BatchLoader(manager, *batch)
-                for item in batch:
-                    item.__dict__.update(_batcher=batcher)
+        route_database(request)
+        manager = None
+        parameters = (*view_args, *view_kwargs.values())
+        for parameter in parameters:
+            if isinstance(parameter, ModelLazyObject) and parameter._wrapped is empty:
+                if manager is None:
+                    manager = BatchLoaderManager()
+                manager[parameter._state.db].add(parameter)
+        if manager is not None:
+            # related objects, like an article and its author, are loaded together with a join
+            plan_joins(parameters)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # grouping the lazy objects does not query the database, so this can run in the event loop
+        return type(self).process_view(self, request, view_func, view_args, view_kwargs)
 
     def __call__(self, request):
-        return self._get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing_token = start_routing(request)
+        token = start_request()
+        if token is None and routing_token is None:
+            return self._get_response(request)
+        response = None
+        try:
+            response = self._get_response(request)
+        finally:
+            finish_request(token, type(self), request, response)
+            finish_routing(routing_token)
+        return response
+
+    async def __acall__(self, request):
+        routing_token = start_routing(request)
+        token = start_request()
+        if token is None and routing_token is None:
+            return await self._get_response(request)
+        response = None
+        try:
+            response = await self._get_response(request)
+        finally:
+            finish_request(token, type(self), request, response)
+            finish_routing(routing_token)
+        return response
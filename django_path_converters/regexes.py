@@ -0,0 +1,281 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+try:
+    from interegular import parse_pattern
+    from interegular.fsm import anything_else
+except ImportError:  # pragma: no cover
+    parse_pattern = anything_else = None
+
+OPTIMIZE_REGEXES_SETTING = 'PATH_CONVERTERS_OPTIMIZE_REGEXES'
+# backreferences and named groups can not be expressed by, or would be lost in, a merged regex
+UNSUPPORTED = re.compile(r'\\[1-9]|\(\?P[=<]')
+CLASS_SPECIAL = re.compile(r'([\\\]\[^-])')
+# sre already dispatches on the first character, merging only pays off for wider alternations
+MIN_MERGED_BRANCHES = 9
+
+
+def regex_optimization_enabled():
+    return settings.configured and getattr(settings, OPTIMIZE_REGEXES_SETTING, False)
+
+
+def scan(pattern):
+    # yields the index and the depth of the unescaped characters of the pattern outside character classes
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 1
+        elif in_class:
+            in_class = char != ']' or pattern[i - 1] == '['
+        elif char == '[':
+            in_class = True
+            if pattern[i + 1:i + 2] == '^':
+                i += 1
+        else:
+            if char == ')':
+                depth -= 1
+            yield i, depth
+            if char == '(':
+                depth += 1
+        i += 1
+
+
+def split_alternatives(pattern):
+    # the alternatives of the pattern at the top level
+    branches = []
+    start = 0
+    for i, depth in scan(pattern):
+        if pattern[i] == '|' and not depth:
+            branches.append(pattern[start:i])
+            start = i + 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def non_capturing(pattern):
+    groups = [i for i, _ in scan(pattern) if pattern[i] == '(' and pattern[i + 1:i + 2] != '?']
+    for i in reversed(groups):
+        pattern = f'{pattern[:i + 1]}?:{pattern[i + 1:]}'
+    return pattern
+
+
+def is_finite(fsm):
+    # True if the fsm accepts a finite number of strings, so no live state is part of a cycle
+    live = {state for state in fsm.states if fsm.islive(state)}
+    visiting, done = set(), set()
+
+    def visit(state):
+        visiting.add(state)
+        for next_state in fsm.map.get(state, {}).values():
+            if next_state in live:
+                if next_state in visiting or (next_state not in done and not visit(next_state)):
+                    return False
+        visiting.discard(state)
+        done.add(state)
+        return True
+
+    return fsm.initial not in live or visit(fsm.initial)
+
+
+def matches_containing(pattern, text):
+    # True if the pattern matches a string that contains the text, None if interegular is missing or can not parse it
+    if parse_pattern is None:
+        return None
+    try:
+        fsm = parse_pattern(pattern).to_fsm() & parse_pattern(rf'[\s\S]*{re.escape(text)}[\s\S]*').to_fsm()
+    except Exception:
+        return None
+    return not fsm.empty()
+
+
+def is_prefix_free(fsm):
+    # True if no string the fsm accepts is a proper prefix of another one, so at most one of these matches at the
+    # start of a string, whatever the order of the alternatives
+    return not any(fsm.islive(next_state) for state in fsm.finals for next_state in fsm.map.get(state, {}).values())
+
+
+def escape_class_char(char):
+    return CLASS_SPECIAL.sub(r'\\\1', char)
+
+
+def char_class(symbols, known):
+    # a regex that matches one of the symbols, anything_else stands for all characters that are not known
+    if anything_else in symbols:
+        excluded = sorted(known - symbols)
+        if not excluded:
+            return r'[\s\S]'
+        return f"[^{''.join(map(escape_class_char, excluded))}]"
+    chars = sorted(symbols)
+    if len(chars) == 1:
+        return re.escape(chars[0])
+    ranges = []
+    start = previous = chars[0]
+    for char in (*chars[1:], None):
+        if char is not None and ord(char) == ord(previous) + 1:
+            previous = char
+            continue
+        if ord(previous) - ord(start) >= 2:
+            ranges.append(f'{escape_class_char(start)}-{escape_class_char(previous)}')
+        else:
+            ranges.append(''.join(escape_class_char(chr(code)) for code in range(ord(start), ord(previous) + 1)))
+        start = previous = char
+    return f"[{''.join(ranges)}]"
+
+
+def finite_fsm_to_regex(fsm):
+    """
+    A regex for an fsm that accepts a finite number of strings.
+
+    The alternatives at each state start with a different character class, such that the regex engine never has
+    to backtrack into another alternative, and common prefixes are matched only once.
+    """
+    by_transition = fsm.alphabet.by_transition
+    known = {symbol for symbol in fsm.alphabet.keys() if symbol is not anything_else}
+    live = {state for state in fsm.states if fsm.islive(state)}
+    cache = {}
+
+    def alternatives(state):
+        result = cache.get(state)
+        if result is None:
+            next_states = {}
+            for transition, next_state in fsm.map.get(state, {}).items():
+                if next_state in live:
+                    next_states.setdefault(next_state, set()).update(by_transition[transition])
+            result = cache[state] = sorted(
+                char_class(symbols, known) + suffix(next_state) for next_state, symbols in next_states.items()
+            )
+        return result
+
+    def suffix(state):
+        # the regex for the strings accepted from the state, that can be appended to a character class
+        branches = alternatives(state)
+        if not branches:
+            return ''
+        if state in fsm.finals:
+            if len(branches) == 1 and re.fullmatch(r'\\?.|\[(?:\\.|[^\]\\])*\]', branches[0]):
+                return f'{branches[0]}?'
+            return f"(?:{'|'.join(branches)})?"
+        if len(branches) == 1:
+            return branches[0]
+        return f"(?:{'|'.join(branches)})"
+
+    branches = alternatives(fsm.initial)
+    if fsm.initial in fsm.finals:
+        return f"(?:{'|'.join(branches)})?" if branches else ''
+    return '|'.join(branches)
+
+
+def fold_char(char):
+    # the lower case of the character, unless that is more than one character, like for 'İ'
+    lower = char.lower()
+    return lower if len(lower) == 1 else char
+
+
+def fold_case(string):
+    """
+    The string with each character in lower case, such that the length never changes, unlike with str.lower or
+    str.casefold. The regex of trie_regex with ignore_case only matches strings that fold to one of its strings.
+    """
+    return ''.join(map(fold_char, string))
+
+
+def trie_regex(strings, ignore_case=False):
+    """
+    A regex that matches exactly the given strings, without interegular.
+
+    The strings are stored in a trie, the alternatives at each node start with a different character, such that the
+    regex engine never has to backtrack into another alternative. With ignore_case, the characters match their lower
+    and upper case.
+    """
+    trie = {}
+    # the characters of the strings per folded character, such that the strings themselves always match
+    variants = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            if ignore_case:
+                folded = fold_char(char)
+                variants.setdefault(folded, {folded}).add(char)
+                char = folded
+            node = node.setdefault(char, {})
+        node[None] = None
+
+    def symbols(char):
+        if not ignore_case:
+            return {char}
+        upper = char.upper()
+        if len(upper) == 1 and fold_char(upper) == char:
+            return {*variants[char], upper}
+        return variants[char]
+
+    def alternatives(node):
+        branches, leaves = [], set()
+        for char in sorted(char for char in node if char is not None):
+            child = node[char]
+            if len(child) == 1 and None in child:
+                # strings that end with this character are merged in one character class
+                leaves.update(symbols(char))
+            else:
+                branches.append(char_class(symbols(char), set()) + suffix(child))
+        if leaves:
+            branches.append(char_class(leaves, set()))
+        return branches
+
+    def suffix(node):
+        branches = alternatives(node)
+        if not branches:
+            return ''
+        if None in node:
+            if len(branches) == 1 and re.fullmatch(r'\\?.|\[(?:\\.|[^\]\\])*\]', branches[0]):
+                return f'{branches[0]}?'
+            return f"(?:{'|'.join(branches)})?"
+        if len(branches) == 1:
+            return branches[0]
+        return f"(?:{'|'.join(branches)})"
+
+    branches = alternatives(trie)
+    if None in trie:
+        return f"(?:{'|'.join(branches)})?" if branches else ''
+    return '|'.join(branches)
+
+
+@lru_cache(maxsize=None)
+def optimize_regex(pattern):
+    """
+    An equivalent regex for the pattern, that is faster to match.
+
+    Capture groups are made non-capturing, duplicate alternatives are removed, and if enough alternatives match a
+    finite number of strings, and none of the strings of the pattern is a prefix of another one, these are merged into
+    one regex that factors out common prefixes. The result is only used if interegular confirms that it matches
+    exactly the same strings, otherwise the pattern is returned.
+    """
+    if parse_pattern is None or UNSUPPORTED.search(pattern):
+        return pattern
+    try:
+        original = parse_pattern(pattern).to_fsm().reduce()
+        parts = []
+        finite = {}
+        for branch in dict.fromkeys(split_alternatives(pattern)):
+            fsm = parse_pattern(branch).to_fsm().reduce()
+            if is_finite(fsm):
+                finite[len(parts)] = fsm
+            parts.append(non_capturing(branch))
+        # the alternatives are tried in order, Django matches the patterns of an include as a prefix, and the merged
+        # regex could then match a different prefix, unless there is only one
+        if len(finite) >= MIN_MERGED_BRANCHES and is_prefix_free(original):
+            first, *others = finite
+            merged = finite[first].union(*(finite[index] for index in others)).reduce()
+            parts[first] = finite_fsm_to_regex(merged)
+            parts = [part for index, part in enumerate(parts) if index not in others]
+        result = '|'.join(parts)
+        re.compile(result)
+        if parse_pattern(result).to_fsm().equivalent(original) and len(result) <= max(4 * len(pattern), 256):
+            return result
+    except Exception:
+        pass
+    return pattern
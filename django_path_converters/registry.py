@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+from django_path_converters.converters import (
+    BaseConverter, ChoicesConverter, LazyLoadMixin, ModelChoicesMixin, ModelListMixin, ModelLoadMixin, NullConverterMixin,
+    PathConverter,
+)
+
+MODEL_CONVERTERS_SETTING = 'PATH_CONVERTERS_MODEL_CONVERTERS'
+
+
+class ModelConverterSpec(namedtuple('ModelConverterSpec', ('name', 'model', 'field_name', 'name_suffix', 'bases'))):
+    # everything needed to create a model converter, without creating the class itself
+
+    @property
+    def full_name(self):
+        name_prefix = next((base.name_prefix for base in self.bases if hasattr(base, 'name_prefix')), '')
+        return f'{name_prefix}{self.name}{self.name_suffix}'
+
+    def materialize(self):
+        spec = self
+
+        class ModelConverter(*spec.bases, BaseConverter):
+            name = spec.name
+            model_class = spec.model
+            field_name = spec.field_name
+            name_suffix = spec.name_suffix
+            from_types = to_types = (spec.model,)
+        if hasattr(ModelConverter, 'get_lookup_plan'):
+            # check the lookup now, instead of for the first value
+            ModelConverter().get_lookup_plan()
+        return ModelConverter
+
+
+model_converter_specs = {}
+
+
+def add_model_converter_spec(*args):
+    spec = ModelConverterSpec(*args)
+    model_converter_specs[spec.full_name] = spec
+
+
+def add_model_converter_specs(model, names):
+    # the specs of the converters of the unique fields and the fields with choices of the model, under each of the names
+    for field_rel in model._meta.get_fields():
+        field = getattr(field_rel, 'field', field_rel)
+        nullable_class = ()
+        if field.unique and hasattr(field, 'primary_path_converter'):
+            base_path_converter = field.primary_path_converter
+            if field.null:
+                nullable_class = (NullConverterMixin,)
+            if field.primary_key:
+                suffixes = (f'.{field.name}', '')
+            else:
+                suffixes = (f'.{field.name}',)
+            for _name in names:
+                for suffix in suffixes:
+                    add_model_converter_spec(_name, model, field.name, suffix, (*nullable_class, ModelLoadMixin, base_path_converter))
+                    add_model_converter_spec(_name, model, field.name, suffix, (*nullable_class, LazyLoadMixin, base_path_converter))
+                    add_model_converter_spec(_name, model, field.name, suffix, (ModelListMixin, base_path_converter))
+    for field in model._meta.concrete_fields:
+        if field.choices:
+            # a converter for the values of the choices, like <choices_app.model.field:…>
+            nullable_class = (NullConverterMixin,) if field.null else ()
+            for _name in names:
+                add_model_converter_spec(_name, model, field.name, f'.{field.name}', (*nullable_class, ModelChoicesMixin, ChoicesConverter))
+
+
+def materialize_converter(name):
+    spec = model_converter_specs.pop(name, None)
+    if spec is not None:
+        return spec.materialize()
+
+
+def materialize_converters(names=None):
+    # materialize the given (or all) converters, and invalidate the converter caches only once
+    if names is None:
+        names = list(model_converter_specs)
+    with PathConverter.bulk_registration():
+        return [klass for klass in map(materialize_converter, names) if klass is not None]
@@ -0,0 +1,163 @@
+import re
+from copy import copy
+from functools import lru_cache
+
+from django.urls import URLPattern, URLResolver, Resolver404
+from django.urls.resolvers import RegexPattern, RoutePattern
+
+try:
+    from interegular import parse_pattern
+except ImportError:  # pragma: no cover
+    parse_pattern = None
+
+PARAMETER = re.compile(r'<(?:(?P<converter>[^>:]+):)?(?P<parameter>[^>]+)>')
+# the regexes of Django's own converters that never match a slash
+SEGMENT_REGEXES = {'[0-9]+', '[^/]+', '[-a-zA-Z0-9_]+', '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'}
+
+
+@lru_cache(maxsize=None)
+def matches_within_segment(regex):
+    # True if the regex can not match a string with a slash, if in doubt, we assume it can
+    if regex in SEGMENT_REGEXES:
+        return True
+    if parse_pattern is None:
+        return False
+    try:
+        return (parse_pattern(regex).to_fsm() & parse_pattern(r'[\s\S]*/[\s\S]*').to_fsm()).empty()
+    except Exception:
+        return False
+
+
+class TrieNode:
+    __slots__ = ('literals', 'parameters', 'prefixes', 'endpoints')
+
+    def __init__(self):
+        self.literals = {}
+        self.parameters = {}
+        # the patterns that might match any path that starts with the segments of this node
+        self.prefixes = []
+        # the patterns that might match a path with exactly the segments of this node
+        self.endpoints = []
+
+    def child(self, segment, converters):
+        # the node for the segment, None if the segment is not a literal or a single parameter that fits in a segment
+        if '<' not in segment:
+            node = self.literals.get(segment)
+            if node is None:
+                node = self.literals[segment] = TrieNode()
+            return node
+        found = PARAMETER.fullmatch(segment)
+        if found is None:
+            return None
+        regex = converters[found.group('parameter')].regex
+        if not matches_within_segment(regex):
+            return None
+        item = self.parameters.get(regex)
+        if item is None:
+            item = self.parameters[regex] = (re.compile(regex), TrieNode())
+        return item[1]
+
+    def add(self, index, pattern):
+        route = getattr(pattern.pattern, '_route', None)
+        if not isinstance(pattern.pattern, RoutePattern) or not isinstance(route, str):
+            # regex and translated patterns are tried for every path
+            self.prefixes.append(index)
+            return
+        segments = route.split('/')
+        is_endpoint = isinstance(pattern, URLPattern)
+        if not is_endpoint:
+            # an include only matches a prefix, the last segment might be only a part of a segment of the path
+            segments.pop()
+        node = self
+        for segment in segments:
+            child = node.child(segment, pattern.pattern.converters)
+            if child is None:
+                node.prefixes.append(index)
+                return
+            node = child
+        (node.endpoints if is_endpoint else node.prefixes).append(index)
+
+    def collect(self, segments, depth, found):
+        found.extend(self.prefixes)
+        if depth == len(segments):
+            found.extend(self.endpoints)
+            return
+        segment = segments[depth]
+        child = self.literals.get(segment)
+        if child is not None:
+            child.collect(segments, depth + 1, found)
+        for regex, child in self.parameters.values():
+            if regex.fullmatch(segment):
+                child.collect(segments, depth + 1, found)
+
+
+class TrieURLResolver(URLResolver):
+    """
+    A URLResolver that only tries the patterns that can match the path.
+
+    The patterns are stored in a trie of the segments of their routes, with the regexes of the converters for
+    parameters that span a whole segment. For each path, the candidate patterns are tried in their original order
+    with Django's own resolve, such that the same ResolverMatch is returned, except that `tried` only contains
+    the candidates. If none of these match, the path is resolved by trying all patterns, to raise the same
+    Resolver404. Included URLconfs are resolved with a trie as well.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._trie = None
+        self._candidate_resolvers = {}
+
+    @classmethod
+    def from_resolver(cls, resolver):
+        return cls(resolver.pattern, resolver.urlconf_name, resolver.default_kwargs, resolver.app_name, resolver.namespace)
+
+    def _build_trie(self):
+        trie = TrieNode()
+        patterns = []
+        for index, pattern in enumerate(self.url_patterns):
+            if type(pattern) is URLResolver:
+                pattern = self.from_resolver(pattern)
+            patterns.append(pattern)
+            trie.add(index, pattern)
+        self._trie_patterns = patterns
+        self._trie = trie
+        return trie
+
+    def _candidate_resolver(self, candidates):
+        # a copy of the resolver with only the candidate patterns
+        resolver = self._candidate_resolvers.get(candidates)
+        if resolver is None:
+            resolver = copy(self)
+            resolver.__dict__['url_patterns'] = [self._trie_patterns[index] for index in candidates]
+            self._candidate_resolvers[candidates] = resolver
+        return resolver
+
+    def resolve(self, path):
+        path = str(path)
+        match = self.pattern.match(path)
+        if match:
+            trie = self._trie
+            if trie is None:
+                trie = self._build_trie()
+            found = []
+            trie.collect(match[0].split('/'), 0, found)
+            if found:
+                try:
+                    return URLResolver.resolve(self._candidate_resolver(tuple(sorted(set(found)))), path)
+                except Resolver404:
+                    pass
+        return super().resolve(path)
+
+
+@lru_cache(maxsize=None)
+def get_trie_resolver(urlconf=None):
+    # the counterpart of django.urls.get_resolver
+    if urlconf is None:
+        from django.conf import settings
+        urlconf = settings.ROOT_URLCONF
+    return TrieURLResolver(RegexPattern(r'^/'), urlconf)
+
+
+def trie_urlpatterns(urlconf):
+    # urlpatterns that resolve the given URLconf with a trie, to use in the module of the ROOT_URLCONF
+    return [TrieURLResolver(RegexPattern(r''), urlconf)]
@@ -0,0 +1,129 @@
+import re
+from weakref import WeakKeyDictionary
+
+from django.urls import get_resolver, get_script_prefix, get_urlconf, reverse as django_reverse
+from django.urls.resolvers import LocalePrefixPattern, get_ns_resolver
+from django.utils.functional import Promise
+from django.utils.http import RFC3986_SUBDELIMS, escape_leading_slashes
+from django.utils.translation import get_language
+from urllib.parse import quote
+
+URL_SAFE_CHARACTERS = RFC3986_SUBDELIMS + '/~:@'
+
+
+def is_reverse_safe(converter):
+    # the converters of Django itself are never safe, the to_url of the UUIDConverter also accepts any string
+    return getattr(converter, 'reverse_safe', False)
+
+
+class ReverseTemplate:
+    # one way to reverse a named pattern: the format string, the parameters with their to_url and the regex to check
+
+    __slots__ = ('result', 'params', 'param_set', 'to_urls', 'regex')
+
+    def __init__(self, result, params, pattern, converters):
+        self.result = result
+        self.params = tuple(params)
+        self.param_set = frozenset(params)
+        self.to_urls = tuple((param, converters[param].to_url if param in converters else str) for param in params)
+        if all(param in converters and is_reverse_safe(converters[param]) for param in params):
+            self.regex = None
+        else:
+            self.regex = re.compile(pattern)
+
+    def reverse(self, prefix, args, kwargs):
+        # returns None if the template can not be used with these arguments
+        if args:
+            if len(args) != len(self.params):
+                return None
+            values = args
+        else:
+            if kwargs.keys() != self.param_set:
+                return None
+            values = [kwargs[param] for param in self.params]
+        subs = {}
+        try:
+            for (param, to_url), value in zip(self.to_urls, values):
+                subs[param] = to_url(value)
+        except ValueError:
+            return None
+        path = self.result % subs
+        if self.regex is not None and not self.regex.match(path):
+            return None
+        return escape_leading_slashes(quote(prefix + path, safe=URL_SAFE_CHARACTERS))
+
+
+_templates = WeakKeyDictionary()
+
+
+def _resolve_namespaces(resolver, path):
+    # a simplified version of the namespace resolution of Django's reverse, without a current_app
+    ns_pattern = ''
+    ns_converters = {}
+    for ns in path:
+        app_list = resolver.app_dict.get(ns)
+        if app_list and ns not in app_list:
+            ns = app_list[0]
+        try:
+            extra, resolver = resolver.namespace_dict[ns]
+        except KeyError:
+            return None
+        ns_pattern += extra
+        ns_converters.update(resolver.pattern.converters)
+    if ns_pattern:
+        resolver = get_ns_resolver(ns_pattern, resolver, tuple(ns_converters.items()))
+    return resolver
+
+
+def is_language_dependent(resolver):
+    # i18n_patterns and translated routes produce a different reverse_dict per language
+    pattern = resolver.pattern
+    if isinstance(pattern, LocalePrefixPattern) or isinstance(getattr(pattern, '_route', getattr(pattern, '_regex', None)), Promise):
+        return True
+    return any(is_language_dependent(sub) for sub in getattr(resolver, 'url_patterns', ()))
+
+
+def compile_reverse(viewname, urlconf=None):
+    # the ReverseTemplates for the viewname, or None if these can not be compiled
+    root = get_resolver(urlconf)
+    *path, view = viewname.split(':')
+    resolver = _resolve_namespaces(root, path)
+    if resolver is None:
+        return None
+    templates = []
+    for possibility, pattern, defaults, converters in resolver.reverse_dict.getlist(view):
+        if defaults:
+            # extra keyword arguments of the path are matched by Django itself
+            return None
+        for result, params in possibility:
+            templates.append(ReverseTemplate(result, params, pattern, converters))
+    return tuple(templates)
+
+
+def reverse(viewname, urlconf=None, args=None, kwargs=None, current_app=None, **extra):
+    """
+    A drop-in replacement for django.urls.reverse that compiles each named pattern once.
+
+    Anything it can not handle itself, like view callables, a current_app or patterns with
+    extra keyword arguments, is passed to Django's reverse, as are arguments that do not fit.
+    """
+    if current_app is None and not extra and isinstance(viewname, str) and not (args and kwargs):
+        if urlconf is None:
+            urlconf = get_urlconf()
+        resolver = get_resolver(urlconf)
+        try:
+            language_dependent, cache = _templates[resolver]
+        except KeyError:
+            language_dependent, cache = _templates[resolver] = is_language_dependent(resolver), {}
+        key = (viewname, get_language()) if language_dependent else viewname
+        try:
+            templates = cache[key]
+        except KeyError:
+            templates = cache[key] = compile_reverse(viewname, urlconf)
+        if templates is not None:
+            prefix = get_script_prefix()
+            for template in templates:
+                url = template.reverse(prefix, args, kwargs or {})
+                if url is not None:
+                    return url
+    return django_reverse(viewname, urlconf, args, kwargs, current_app, **extra)
@@ -0,0 +1,92 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import router
+from django.db.models import QuerySet
+
+from django_path_converters.utils import get_model, get_queryset_or_manager
+
+DATABASES_SETTING = 'PATH_CONVERTERS_DATABASES'
+# the hint passed to db_for_read of the database routers, such that these can recognize the lookups of converters
+ROUTER_HINT = 'path_converter'
+
+_request_database = ContextVar('path_converters_database', default=None)
+
+
+def read_database(model_or_queryset):
+    # the alias to load the objects of a converter from: that of the queryset, of the request, or of the routers
+    if isinstance(model_or_queryset, QuerySet) and model_or_queryset._db is not None:
+        return model_or_queryset._db
+    alias = _request_database.get()
+    if alias is not None:
+        return alias
+    return router.db_for_read(get_model(model_or_queryset), **{ROUTER_HINT: True})
+
+
+def read_queryset(model_or_queryset):
+    return get_queryset_or_manager(model_or_queryset, '_default_manager').using(read_database(model_or_queryset))
+
+
+def pin_writes(obj):
+    # an object that is read from the alias of a METHODS or ROUTES override has that alias as _state.db, and without
+    # a router for writes, Django would save it there as well, so it is moved to the database for writes
+    alias = _request_database.get()
+    if alias is not None and obj is not None and obj._state.db == alias:
+        obj._state.db = router.db_for_write(type(obj))
+    return obj
+
+
+_config = None
+_config_loaded = False
+
+
+def get_databases_config():
+    # a dict with the METHODS and ROUTES that map to an alias, None if there are no overrides
+    global _config, _config_loaded
+    if not _config_loaded:
+        config = getattr(settings, DATABASES_SETTING, None)
+        if config:
+            _config = {
+                'METHODS': {method.upper(): alias for method, alias in config.get('METHODS', {}).items()},
+                'ROUTES': dict(config.get('ROUTES', {})),
+            }
+        else:
+            _config = None
+        _config_loaded = True
+    return _config
+
+
+def reset_databases_config(*args, setting=None, **kwargs):
+    global _config, _config_loaded
+    if setting is None or setting == DATABASES_SETTING:
+        _config = None
+        _config_loaded = False
+
+
+def start_routing(request):
+    # returns the token to pass to finish_routing, None if there are no overrides
+    config = get_databases_config()
+    if config is not None:
+        return _request_database.set(config['METHODS'].get(request.method))
+
+
+def route_database(request):
+    # once the view is known, a route can override the alias of the method, by its view name or its route
+    config = get_databases_config()
+    resolver_match = getattr(request, 'resolver_match', None)
+    if config is None or not config['ROUTES'] or resolver_match is None:
+        return
+    routes = config['ROUTES']
+    for key in (resolver_match.view_name, resolver_match.route):
+        if key in routes:
+            _request_database.set(routes[key])
+            return
+
+
+def finish_routing(token):
+    if token is not None:
+        _request_database.reset(token)
+
+
+setting_changed.connect(reset_databases_config)
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# sent when a field that was deferred by the queryset of a converter is accessed on a lazy object,
+# with the instance and the field_name as arguments
+deferred_field_accessed = Signal()
+
+# sent at the end of a request by the QueryBatcherMiddleware if PATH_CONVERTERS_INSTRUMENTATION is set,
+# with the request and the LazyObjectStats as arguments
+lazy_objects_measured = Signal()
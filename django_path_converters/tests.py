@@ -1,6 +1,49 @@
-from django.test import TestCase
+from django.db import models
+from django.http import Http404, HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import path
 from django.urls.converters import get_converters
 
+
+class ActiveManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(active=True)
+
+
+class Board(models.Model):
+    # a model with a default manager that filters, the lazy objects of its tickets are not joined with it
+    active = models.BooleanField(default=True)
+
+    objects = ActiveManager()
+
+    class Meta:
+        app_label = 'django_path_converters'
+
+
+class Ticket(models.Model):
+    # a model with choices, for the choices converters of the model fields
+    class Status(models.TextChoices):
+        OPEN = 'open'
+        CLOSED = 'closed'
+
+    status = models.CharField(max_length=8, choices=Status)
+    priority = models.IntegerField(null=True, choices=[(1, 'Low'), (2, 'High')])
+    board = models.ForeignKey(Board, null=True, on_delete=models.CASCADE)
+
+    class Meta:
+        app_label = 'django_path_converters'
+
+
+def username_view(request, user):
+    return HttpResponse(user.get_username())
+
+
+urlpatterns = [
+    path('user/<auth.user.username:user>/', username_view),
+    path('item/<uuid:key>/', username_view, name='item'),
+]
+
+
 class PathConverterTest(TestCase):
     def assertValidPathConverterExample(self, path_converter, example):
         target_type = tuple(getattr(target_type, '__origin__', target_type) for target_type in path_converter.to_types)
@@ -27,7 +70,722 @@ class PathConverterTest(TestCase):
         Group.objects.create(level=25)
 
     def test_path_converter_examples(self):
+        from django_path_converters.registry import materialize_converters
+        # the converters that are not listed in PATH_CONVERTERS_MODEL_CONVERTERS are tested as well
+        materialize_converters()
         for converter in get_converters().values():
             for example in getattr(converter, 'examples', ()):
                 with self.subTest(converter=converter, example=example):
-                    self.assertValidPathConverterExample(converter, example)
\ No newline at end of file
+                    self.assertValidPathConverterExample(converter, example)
+
+
+class CombinedConverterTest(TestCase):
+    def test_combined_converter_parts(self):
+        from datetime import date
+        from django_path_converters.converters import DateRangeConverter
+        converter = DateRangeConverter()
+        value = converter.to_python('1958-3-25/2019-11-25')
+        self.assertEqual(value, (date(1958, 3, 25), date(2019, 11, 25)))
+        self.assertEqual(converter.to_url(value), '1958-03-25/2019-11-25')
+
+
+class DateParseTest(TestCase):
+    def test_parse_datetime_like_strptime(self):
+        from datetime import datetime
+        from django_path_converters.dateparse import parse_datetime
+        formats = ('%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%d', '%Y-%m', '%G-W%V%u', '%Y-%j')
+        values = ('2023-01-24T19:21:18Z', '2023-01-24T19:21:18-01:30', '2023-1-5', '2023-02-30', '2020-W531', '2023-045', '2023-01-24x')
+        for value in values:
+            for date_format in formats:
+                with self.subTest(value=value, date_format=date_format):
+                    try:
+                        expected = datetime.strptime(value, date_format)
+                    except ValueError as e:
+                        with self.assertRaisesMessage(ValueError, str(e)):
+                            parse_datetime(value, date_format)
+                    else:
+                        self.assertEqual(parse_datetime(value, date_format), expected)
+
+
+class OptimizeRegexTest(TestCase):
+    def test_equivalent_regexes(self):
+        import re
+        from django_path_converters.regexes import optimize_regex
+        words = [f'{prefix}{i}' for prefix in ('draft', 'drop', 'public') for i in range(4)]
+        self.assertEqual(optimize_regex('|'.join(words)), r'dr(?:aft[0-3]|op[0-3])|public[0-3]')
+        self.assertEqual(optimize_regex('[Yy]([Ee][Ss])?|[0-9]+'), '[Yy](?:[Ee][Ss])?|[0-9]+')
+        self.assertEqual(optimize_regex('(?P<a>x)|(?P=a)'), '(?P<a>x)|(?P=a)')
+        optimized = re.compile(optimize_regex(f"(?:{'|'.join(words)})||[Nn][Uu][Ll]{{2}}"))
+        for value in (*words, '', 'null', 'draft', 'publi', 'nul'):
+            with self.subTest(value=value):
+                self.assertEqual(bool(optimized.fullmatch(value)), value in words or value in ('', 'null'))
+
+    def test_same_prefix_match(self):
+        import re
+        from django_path_converters.regexes import optimize_regex
+        # the patterns of an include are matched as a prefix, where 'a' comes before 'ab'
+        pattern = '|'.join(['a', 'ab', *'cdefghij'])
+        self.assertEqual(re.match(optimize_regex(pattern), 'abz').group(), 'a')
+
+
+class ChoicesConverterTest(TestCase):
+    def test_choices_and_enum_converters(self):
+        import re
+        from enum import Enum
+        from django.db.models import IntegerChoices
+        from django_path_converters.converters import ChoicesConverter, EnumConverter
+
+        class Size(IntegerChoices):
+            SMALL = 1
+            LARGE = 10
+
+        class Color(Enum):
+            RED = 'red'
+            GREEN = 'green'
+
+        class SizeConverter(ChoicesConverter, choices=Size):
+            name = 'test_size'
+
+        class ColorConverter(EnumConverter, enum_class=Color):
+            name = 'test_color'
+            ignore_case = True
+
+        size, color = SizeConverter(), ColorConverter()
+        self.assertEqual((size.to_python('10'), size.to_url(Size.SMALL), size.to_url(10)), (Size.LARGE, '1', '10'))
+        self.assertEqual((color.to_python('ReD'), color.to_url(Color.GREEN), color.to_url('GREEN')), (Color.RED, 'green', 'green'))
+        self.assertEqual([value for value in ('1', '10', '100', '') if re.fullmatch(SizeConverter.regex, value)], ['1', '10'])
+        with self.assertRaises(ValueError):
+            size.to_url(5)
+        with self.assertRaises(ValueError):
+            class ClashingConverter(ChoicesConverter, choices=[(1, 'one'), ('1', 'One')]):
+                pass
+        with self.assertRaises(ValueError):
+            # equal values, so to_url can only return one of the URLs
+            class EqualConverter(ChoicesConverter, choices=[True, 1]):
+                pass
+
+        class CityConverter(ChoicesConverter, choices=['İstanbul', 'Straße']):
+            name = 'test_city'
+            ignore_case = True
+
+        city = CityConverter()
+        matches = [value for value in ('İstanbul', 'İSTANBUL', 'STRAßE', 'straße', 'istanbul') if re.fullmatch(CityConverter.regex, value)]
+        self.assertEqual(matches, ['İstanbul', 'İSTANBUL', 'STRAßE', 'straße'])
+        self.assertEqual([city.to_python(value) for value in matches], ['İstanbul', 'İstanbul', 'Straße', 'Straße'])
+
+    def test_model_choices_converters(self):
+        import re
+        from django_path_converters.registry import add_model_converter_specs, materialize_converters
+        # the model is created after the app is ready, so its specs are added like in PathConvertersConfig.ready
+        add_model_converter_specs(Ticket, ('django_path_converters.ticket',))
+        materialize_converters(['choices_django_path_converters.ticket.status', 'choices_django_path_converters.ticket.priority'])
+        converters = get_converters()
+        status, priority = converters['choices_django_path_converters.ticket.status'], converters['choices_django_path_converters.ticket.priority']
+        self.assertEqual((status.to_python('closed'), status.to_url(Ticket.Status.OPEN)), ('closed', 'open'))
+        self.assertIsNone(re.fullmatch(status.regex, ''))
+        with self.assertRaises(ValueError):
+            status.to_python('pending')
+        self.assertEqual([priority.to_python(value) for value in ('2', '', 'null')], [2, None, None])
+        self.assertEqual((priority.to_url(1), priority.to_url(None)), ('1', 'null'))
+        self.assertIsNone(re.fullmatch(priority.regex, '3'))
+
+
+class TrieURLResolverTest(TestCase):
+    def test_resolve_like_django(self):
+        from django.urls import Resolver404, get_resolver
+        from django_path_converters.resolvers import get_trie_resolver
+        urlconf = 'django.contrib.auth.urls'
+        resolver, trie_resolver = get_resolver(urlconf), get_trie_resolver(urlconf)
+        for url in ('/login/', '/reset/MQ/set-password/', '/reset/done/', '/reset/MQ/', '/unknown/'):
+            with self.subTest(url=url):
+                try:
+                    expected = resolver.resolve(url)
+                except Resolver404 as e:
+                    with self.assertRaises(Resolver404) as raised:
+                        trie_resolver.resolve(url)
+                    self.assertEqual(raised.exception.args, e.args)
+                else:
+                    match = trie_resolver.resolve(url)
+                    self.assertEqual((match.func, match.kwargs, match.url_name, match.route), (expected.func, expected.kwargs, expected.url_name, expected.route))
+
+
+class UrlOverlapTest(TestCase):
+    regexes = ['/foo/(?P<ab>.+)/', '/foo/bar/', '/(?P<pk>[0-9]+)/', '/bar/', '/(?P<wildcard>.+)', '/unreachable']
+
+    def test_candidate_pairs(self):
+        from django_path_converters.management.commands.url_overlap import candidate_pairs, compare_patterns, parse_url_regex
+        regexes = self.regexes
+        pairs = candidate_pairs([parse_url_regex(regex) for regex in regexes])
+        self.assertEqual(pairs, [(0, 1), (0, 4), (1, 4), (2, 4), (3, 4), (4, 5)])
+        verdict, overlap = compare_patterns((4, 5, regexes[4], regexes[5], parse_url_regex(regexes[4]), parse_url_regex(regexes[5]), 1, None))
+        self.assertEqual(verdict, (False, True))
+        self.assertEqual(overlap, (4, 5, False, True, '/unreachable', ({'wildcard': 'unreachable'}, {})))
+
+    def test_cache(self):
+        from tempfile import TemporaryDirectory
+        from django_path_converters.management.commands.url_overlap import Command, OverlapCache
+        with TemporaryDirectory() as directory:
+            results = []
+            for _ in range(2):
+                cache = OverlapCache(f'{directory}/overlap.cache')
+                cache.load()
+                regexes = [(regex, cache.get_fsm(regex)) for regex in self.regexes]
+                results.append(Command().compare_all(regexes, 1, jobs=1, cache=cache))
+                cache.save()
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(cache.report(), '6/6 patterns, 6/6 pairs')
+
+    def test_pickling_is_scoped(self):
+        import copyreg
+        import pickle
+        from interegular.fsm import anything_else
+        from django_path_converters.management.commands.url_overlap import Command, dumps_fsms, parse_url_regex
+        self.assertNotIn(type(anything_else), copyreg.dispatch_table)
+        fsm = pickle.loads(dumps_fsms(parse_url_regex('a[^b]c')))
+        self.assertTrue(any(symbol is anything_else for symbol in fsm.alphabet.keys()))
+        regexes = [(regex, parse_url_regex(regex)) for regex in self.regexes]
+        self.assertEqual(Command().compare_all(regexes, 1, jobs=2), Command().compare_all(regexes, 1, jobs=1))
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_benchmark_and_compare(self):
+        import json
+        from io import StringIO
+        from tempfile import NamedTemporaryFile
+        from django.core.management import call_command, CommandError
+        options = {'number': 1, 'repeat': 1, 'urlconf': 'django.contrib.auth.urls', 'stdout': StringIO()}
+        with NamedTemporaryFile('w+', suffix='.json') as f:
+            call_command('benchmark_converters', output=f.name, **options)
+            results = json.load(f)
+            self.assertIn('date:2023-01-21', results['converters'])
+            self.assertEqual(results['routes']['reset/<uidb64>/<token>/']['queries'], 0)
+            for metrics in results['converters'].values():
+                metrics.update((metric, 0.0) for metric in metrics)
+            f.seek(0)
+            f.truncate()
+            json.dump(results, f)
+            f.flush()
+            with self.assertRaises(CommandError):
+                call_command('benchmark_converters', baseline=f.name, stderr=StringIO(), **options)
+
+    def test_load_lazy_objects(self):
+        from django.contrib.auth.models import User
+        from django.urls import ResolverMatch
+        from django_path_converters.lazymodelobject import ModelLazyObject
+        from django_path_converters.management.commands.benchmark_converters import load_lazy_objects
+        users = [User.objects.create(username=f'user{i}') for i in range(2)]
+        kwargs = {f'user{i}': ModelLazyObject(User, pk) for i, pk in enumerate((users[0].pk, users[1].pk, 0))}
+        with self.assertNumQueries(1):
+            load_lazy_objects('/', ResolverMatch(None, (), kwargs))
+        with self.assertRaises(ValueError):
+            load_lazy_objects('/', ResolverMatch(None, (), {'user': ModelLazyObject(User, 'first')}))
+
+
+class RequireQueryDictTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        cls.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+
+    def test_lazy_bulk_conversion(self):
+        from django.test import RequestFactory
+        from django_path_converters.decorators import require_querydict
+
+        @require_querydict(_required=('user',), user='auth.user', eager='eager_auth.user.username', page='int')
+        def view(request, **kwargs):
+            return request.GET
+
+        pks = '&'.join(f'user={user.pk}' for user in self.users)
+        with self.assertNumQueries(0):
+            data = view(RequestFactory().get(f'/?{pks}&page=2&eager=user0&eager=user2&q=x'), slug='ignored')
+            self.assertEqual((data['page'], data['q']), (2, 'x'))
+        with self.assertNumQueries(2):
+            self.assertEqual([user.username for user in data.getlist('user')], ['user0', 'user1', 'user2'])
+            self.assertEqual([user.pk for user in data.getlist('eager')], [self.users[0].pk, self.users[2].pk])
+        for query in ('page=2', 'user=1&page=x', 'user=1&eager=user0&eager=unknown'):
+            with self.subTest(query=query), self.assertRaises(Http404):
+                view(RequestFactory().get(f'/?{query}')).lists()
+
+    def test_copy_and_urlencode(self):
+        import copy
+        from django.http import QueryDict
+        from django.test import RequestFactory
+        from django_path_converters.decorators import require_querydict
+
+        @require_querydict(user='auth.user', page='int')
+        def view(request):
+            return request.GET
+
+        data = view(RequestFactory().get(f'/?user={self.users[0].pk}&user={self.users[1].pk}&page=2&q=x'))
+        self.assertIsInstance(data, QueryDict)
+        with self.assertRaises(AttributeError):
+            data['page'] = 3
+        with self.assertNumQueries(1):
+            self.assertEqual([user.username for user in data.getlist('user')], ['user0', 'user1'])
+        for result in (data.copy(), copy.copy(data), copy.deepcopy(data)):
+            with self.subTest(result=type(result)), self.assertNumQueries(0):
+                self.assertEqual((result['page'], result['user'].username), (2, 'user1'))
+                result['page'] = '3'
+                self.assertEqual(result.urlencode(), f'user={self.users[0].pk}&user={self.users[1].pk}&page=3&q=x')
+        self.assertEqual(data['page'], 2)
+        self.assertEqual(data.urlencode(), f'user={self.users[0].pk}&user={self.users[1].pk}&page=2&q=x')
+
+    @override_settings(PATH_CONVERTERS_NEGATIVE_CACHE={'TIMEOUT': 60, 'MAX_ENTRIES': 10})
+    def test_bulk_uses_negative_cache(self):
+        from django.test import RequestFactory
+        from django_path_converters.decorators import require_querydict
+
+        @require_querydict(eager='eager_auth.user.username')
+        def view(request):
+            return request.GET.getlist('eager')
+
+        for queries in (1, 0):
+            with self.subTest(queries=queries), self.assertNumQueries(queries), self.assertRaises(Http404):
+                view(RequestFactory().get('/?eager=unknown&eager=missing'))
+
+    def test_class_based_view(self):
+        from django.test import RequestFactory
+        from django.views import View
+        from django_path_converters.decorators import RequireQueryStringMixin
+
+        class UserView(RequireQueryStringMixin, View):
+            querystring_required = ('owner',)
+            querystring_converters = {'owner': 'auth.user', 'user': 'auth.user'}
+
+            def get(self, request):
+                return HttpResponse(' '.join(user.username for user in (request.GET['owner'], *request.GET.getlist('user'))))
+
+        view = UserView.as_view()
+        with self.assertNumQueries(1):
+            response = view(RequestFactory().get(f'/?owner={self.users[2].pk}&user={self.users[0].pk}&user={self.users[1].pk}'))
+        self.assertEqual(response.content, b'user2 user0 user1')
+        plan = UserView._querystring_plan
+        with self.assertRaises(Http404):
+            view(RequestFactory().get('/?user=1'))
+        self.assertIs(UserView._querystring_plan, plan)
+
+
+class ModelListConverterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        cls.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+
+    def test_lazy_ordered_list(self):
+        import re
+        from django.contrib.auth.models import User
+        converter = get_converters()['list_auth.user']
+        value = ','.join(str(user.pk) for user in self.users[::-1])
+        self.assertRegex(value, f'^{converter.regex}$')
+        with self.assertNumQueries(1):
+            users = converter.to_python(value)
+            self.assertIsInstance(users, list)
+            self.assertEqual(len(users), 3)
+            self.assertEqual([user.username for user in users], ['user2', 'user1', 'user0'])
+        with self.assertNumQueries(0):
+            self.assertEqual(converter.to_url(users), value)
+            self.assertEqual(converter.to_url(self.users), ','.join(str(user.pk) for user in self.users))
+        with self.assertNumQueries(1):
+            self.assertEqual(converter.to_url(User.objects.filter(username='user1')), str(self.users[1].pk))
+        with self.assertRaises(Http404):
+            list(converter.to_python(f'{self.users[0].pk},0'))
+        by_username = get_converters()['list_auth.user.username']
+        self.assertIsNone(re.fullmatch(by_username.regex, 'user0,'))
+        self.assertEqual([user.pk for user in by_username.to_python('user1,user1')], [self.users[1].pk] * 2)
+
+    def test_invalid_subclasses(self):
+        base = type(get_converters()['list_auth.user'])
+        with self.assertRaises(ValueError):
+            type('NoItems', (base,), {'max_count': 0})
+        with self.assertRaises(ValueError):
+            # the keys can contain the separator
+            type('SplitOnOne', (base,), {'separator': '1'})
+        by_username = type(get_converters()['list_auth.user.username'])
+        self.assertEqual(type('BySemicolon', (by_username,), {'separator': ';'}).regex, '(?:[^/;]+)(?:;(?:[^/;]+))*')
+        with self.assertRaises(ValueError):
+            # the regex of the item is written differently than that of the StringConverter, and allows a comma
+            type('AnyUsername', (by_username,), {'item_regex': '[^/]+'})
+
+
+class QueryBatcherTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        cls.users = [User.objects.create(username=f'user{i}') for i in range(3)]
+
+    def test_batch_load_one_query_per_model(self):
+        from django_path_converters.lazymodelobject import BatchLoaderManager
+        by_pk, by_username = get_converters()['auth.user'], get_converters()['auth.user.username']
+        objs = [by_pk.to_python(str(self.users[0].pk)), by_username.to_python('user1'), by_pk.to_python('0')]
+        manager = BatchLoaderManager()
+        for obj in objs:
+            manager[obj._state.db].add(obj)
+        with self.assertNumQueries(1):
+            self.assertEqual(objs[0].username, 'user0')
+            self.assertEqual(objs[1].pk, self.users[1].pk)
+            with self.assertRaises(Http404):
+                objs[2].username
+
+    def test_lazy_object_layout(self):
+        from django.contrib.auth.models import User
+        from django.db.models.base import ModelState
+        by_pk, by_username = get_converters()['auth.user'], get_converters()['auth.user.username']
+        obj, named = by_pk.to_python(str(self.users[0].pk)), by_username.to_python('user1')
+        with self.assertNumQueries(0):
+            self.assertIsInstance(obj, User)
+            self.assertIn('username', dir(obj))
+            self.assertEqual((obj.pk, obj.id, named.username), (self.users[0].pk, self.users[0].pk, 'user1'))
+            self.assertIs(obj._state, obj._state)
+            self.assertIsInstance(obj._state, ModelState)
+            self.assertEqual((obj._state.db, obj._state.adding), ('default', False))
+            self.assertFalse(obj.__dict__)
+        with self.assertNumQueries(1):
+            self.assertEqual(named.pk, self.users[1].pk)
+        self.assertIs(named._state, named._wrapped._state)
+
+    def test_lookup_plan(self):
+        from django.contrib.auth.models import User
+        from django.core.exceptions import FieldError
+        from django_path_converters.lazymodelobject import LookupPlan, ModelLazyObject
+        converter = get_converters()['auth.user.username']
+        plan = type(converter).__dict__['_lookup_plan']
+        self.assertEqual((plan.model, plan.field, plan.is_pk), (User, User._meta.get_field('username'), False))
+        self.assertEqual(converter.to_python('user1')._pk_field, 'username')
+        with self.assertRaises(FieldError):
+            LookupPlan.build(User, 'nickname')
+        plan = LookupPlan.build(User, 'username__iexact')
+        self.assertEqual(ModelLazyObject.from_plan(plan, 'USER1').pk, self.users[1].pk)
+
+    def test_lookup_plans_cleared_for_new_models(self):
+        from django.contrib.auth.models import User
+        from django.db.models.signals import class_prepared
+        from django_path_converters.lazymodelobject import get_lookup_plan
+        get_lookup_plan(User)
+        class_prepared.send(sender=User)
+        self.assertEqual(get_lookup_plan.cache_info().currsize, 0)
+
+    def test_converter_queryset_projection(self):
+        from django_path_converters.decorators import converter_queryset
+        from django_path_converters.signals import deferred_field_accessed
+        accessed = []
+
+        def receiver(sender, field_name, **kwargs):
+            accessed.append(field_name)
+
+        @converter_queryset(user={'only': ('username',)})
+        def view(request, user):
+            return user.username, user.email
+
+        deferred_field_accessed.connect(receiver)
+        try:
+            with self.assertNumQueries(2):
+                user = get_converters()['auth.user'].to_python(str(self.users[0].pk))
+                self.assertEqual(view(None, user=user), ('user0', ''))
+        finally:
+            deferred_field_accessed.disconnect(receiver)
+        self.assertEqual(accessed, ['email'])
+
+    def test_deferred_field_accessed_first(self):
+        from django_path_converters.decorators import converter_queryset
+        from django_path_converters.lazymodelobject import BatchLoaderManager
+        from django_path_converters.signals import deferred_field_accessed
+        accessed = []
+
+        def receiver(sender, field_name, **kwargs):
+            accessed.append(field_name)
+
+        @converter_queryset(user={'only': ('username',)}, other={'only': ('username',)})
+        def view(request, user, other):
+            return user.email, other.email
+
+        converter = get_converters()['auth.user']
+        manager = BatchLoaderManager()
+        deferred_field_accessed.connect(receiver)
+        try:
+            for batched in (False, True):
+                objs = [converter.to_python(str(user.pk)) for user in self.users[:2]]
+                if batched:
+                    for obj in objs:
+                        manager[obj._state.db].add(obj)
+                self.assertEqual(view(None, user=objs[0], other=objs[1]), ('', ''))
+        finally:
+            deferred_field_accessed.disconnect(receiver)
+        self.assertEqual(accessed, ['email', 'email'] * 2)
+
+    def test_joins_respect_default_managers(self):
+        from django.contrib.auth.models import Permission
+        from django.contrib.contenttypes.models import ContentType
+        from django_path_converters.lazymodelobject import ModelLazyObject, plan_joins
+        permission, content_type = ModelLazyObject(Permission, 1), ModelLazyObject(ContentType, 1)
+        plan_joins([permission, content_type])
+        self.assertIs(permission._join, content_type._join)
+        self.assertIsNotNone(permission._join)
+        ticket, board = ModelLazyObject(Ticket, 1), ModelLazyObject(Board, 1)
+        plan_joins([ticket, board])
+        self.assertIsNone(ticket._join)
+
+    def test_async_batch_load(self):
+        from asgiref.sync import async_to_sync
+        from django_path_converters.lazymodelobject import BatchLoaderManager
+        converter = get_converters()['auth.user']
+        objs = [converter.to_python(str(user.pk)) for user in self.users]
+        manager = BatchLoaderManager()
+        for obj in objs:
+            manager[obj._state.db].add(obj)
+
+        async def load():
+            return (await objs[0]).username, (await objs[2].aload()).username
+
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(load)(), ('user0', 'user2'))
+
+    def test_lazy_object_converter(self):
+        from django.contrib.auth.models import User
+        from django_path_converters.lazymodelobject import BatchLoaderManager
+        converters = get_converters()
+        self.assertIs(converters['model'].to_python('auth/User'), User)
+        with self.assertRaises(ValueError):
+            converters['model'].to_python('auth/unknown')
+        with self.assertNumQueries(1):
+            self.assertEqual(converters['eagerobject'].to_python(f'auth/user/{self.users[0].pk}'), self.users[0])
+        manager = BatchLoaderManager()
+        with self.assertNumQueries(0):
+            objs = [converters['object'].to_python(f'auth/user/{user.pk}') for user in self.users]
+            for obj in objs:
+                manager[obj._state.db].add(obj)
+        with self.assertNumQueries(1):
+            self.assertEqual([obj.username for obj in objs], ['user0', 'user1', 'user2'])
+
+    def test_join_related_objects(self):
+        from django.contrib.auth.models import Permission
+        from django_path_converters.middleware import QueryBatcherMiddleware
+        permission = Permission.objects.select_related('content_type').first()
+        permissions, content_types = get_converters()['auth.permission'], get_converters()['contenttypes.contenttype']
+        middleware = QueryBatcherMiddleware(lambda request: None)
+        kwargs = {'content_type': content_types.to_python(str(permission.content_type_id)), 'permission': permissions.to_python(str(permission.pk))}
+        middleware.process_view(None, None, (), kwargs)
+        with self.assertNumQueries(1):
+            self.assertEqual(kwargs['content_type'].model, permission.content_type.model)
+            self.assertEqual(kwargs['permission'].codename, permission.codename)
+        # not related, so the join finds nothing, and both are loaded on their own
+        other = Permission.objects.exclude(content_type=permission.content_type).first()
+        kwargs = {'content_type': content_types.to_python(str(permission.content_type_id)), 'permission': permissions.to_python(str(other.pk))}
+        middleware.process_view(None, None, (), kwargs)
+        with self.assertNumQueries(3):
+            self.assertEqual((kwargs['permission'].codename, kwargs['content_type'].model), (other.codename, permission.content_type.model))
+
+
+@override_settings(
+    ROOT_URLCONF='django_path_converters.tests',
+    MIDDLEWARE=['django_path_converters.middleware.QueryBatcherMiddleware'],
+    PATH_CONVERTERS_INSTRUMENTATION={'HEADERS': True},
+)
+class InstrumentationTest(TestCase):
+    def test_lazy_object_stats(self):
+        from django.contrib.auth.models import User
+        from django_path_converters.instrumentation import HEADER
+        from django_path_converters.signals import lazy_objects_measured
+        User.objects.create(username='measured')
+        measured = []
+
+        def receiver(sender, request, stats, **kwargs):
+            measured.append(stats.as_dict())
+
+        lazy_objects_measured.connect(receiver)
+        try:
+            response = self.client.get('/user/measured/')
+            self.assertEqual(response.content, b'measured')
+            self.assertEqual(self.client.get('/user/unknown/').status_code, 404)
+        finally:
+            lazy_objects_measured.disconnect(receiver)
+        self.assertTrue(response[HEADER].startswith('created=1; evaluated=1; batched=1; cached=0; queried=0; missing=0;'))
+        self.assertIn('lazy-objects;dur=', response['Server-Timing'])
+        self.assertEqual([stats['route'] for stats in measured], ['user/<auth.user.username:user>/'] * 2)
+        self.assertEqual(measured[1]['converters']['auth.user.username']['missing'], 1)
+
+    def test_converter_stats(self):
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from django_path_converters.instrumentation import export_converter_stats, get_converter_stats
+        converter = get_converters()['fullint']
+        with tempfile.TemporaryDirectory() as directory:
+            dump = os.path.join(directory, 'stats-{pid}.json')
+            sunk = []
+            with self.settings(PATH_CONVERTERS_CONVERTER_STATS={'DUMP': dump, 'SINK': sunk.append}):
+                get_converter_stats().reset()
+                self.assertEqual(self.client.get('/user/unknown/').status_code, 404)
+                self.assertEqual(converter.to_url(converter.to_python('-12')), '-12')
+                with self.assertRaises(ValueError):
+                    converter.to_python('twelve')
+                data = export_converter_stats()
+                stdout = StringIO()
+                call_command('converter_stats', stdout=stdout)
+            self.assertNotIn('to_python', vars(converter))
+            self.assertEqual(sunk, [data])
+            with open(dump.format(pid=data['pid'])) as f:
+                self.assertEqual(json.load(f), data)
+        timing = data['converters']['fullint']['to_python']
+        self.assertEqual((timing['calls'], timing['rejected'], sum(timing['histogram'])), (2, 1, 2))
+        self.assertEqual(data['converters']['auth.user.username']['to_python']['calls'], 1)
+        self.assertIn('auth.user.username', stdout.getvalue())
+
+    def test_converter_stats_export(self):
+        from unittest import mock
+        from django.core.exceptions import ImproperlyConfigured
+        from django_path_converters import instrumentation
+        with self.assertRaises(ImproperlyConfigured):
+            with self.settings(PATH_CONVERTERS_CONVERTER_STATS={'DUMP': '/var/tmp/converter-stats.json'}):
+                pass
+        converter = get_converters()['fullint']
+        with mock.patch.object(instrumentation, '_export_registered', False), mock.patch('atexit.register') as register:
+            with self.settings(PATH_CONVERTERS_CONVERTER_STATS={'SINK': list}):
+                instrumentation.get_converter_stats().reset()
+                register.assert_not_called()
+                converter.to_python('12')
+                converter.to_python('13')
+        register.assert_called_once_with(instrumentation.export_converter_stats)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PATH_CONVERTERS_OBJECT_CACHE={'MODELS': {'auth.user': {'TIMEOUT': 60}}},
+)
+class ModelObjectCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from django.contrib.auth.models import User
+        cache.clear()
+        self.user = User.objects.create(username='cached')
+
+    def test_cache_hit_and_invalidation(self):
+        from django_path_converters.cache import get_object_cache
+        converter = get_converters()['eager_auth.user.username']
+        with self.assertNumQueries(2):
+            self.assertEqual(converter.to_python('cached').pk, self.user.pk)
+            self.assertEqual(get_converters()['auth.user'].to_python(str(self.user.pk)).username, 'cached')
+            self.assertEqual(converter.to_python('cached').pk, self.user.pk)
+        self.user.username = 'renamed'
+        self.user.save()
+        with self.assertNumQueries(1), self.assertRaises(Http404):
+            converter.to_python('cached')
+        self.assertEqual(get_object_cache().stats()['auth.user'], {'hits': 1, 'misses': 3})
+
+    def test_invalidation_across_processes(self):
+        from django.contrib.auth.models import User
+        from django_path_converters.cache import ModelObjectCache
+        # two processes that share the cache backend
+        first, second = ModelObjectCache(models=['auth.user']), ModelObjectCache(models=['auth.user'])
+        first.set(User, 'username', self.user)
+        self.assertEqual(second.get(User, 'username', 'cached'), self.user)
+        second.set(User, 'pk', self.user)
+        first.invalidate(self.user, 'default')
+        self.assertIsNone(second.get(User, 'username', 'cached'))
+        self.assertIsNone(second.get(User, 'pk', self.user.pk))
+        second.set(User, 'pk', self.user)
+        self.assertEqual(first.get(User, 'pk', self.user.pk), self.user)
+
+
+@override_settings(PATH_CONVERTERS_NEGATIVE_CACHE={'TIMEOUT': 60, 'MAX_ENTRIES': 2})
+class NegativeLookupCacheTest(TestCase):
+    def test_repeated_misses_without_query(self):
+        from django.contrib.auth.models import User
+        from django_path_converters.cache import get_negative_cache
+        lazy, eager = get_converters()['auth.user.username'], get_converters()['eager_auth.user.username']
+        with self.assertNumQueries(1):
+            for converter in (eager, lazy, eager):
+                with self.assertRaises(Http404):
+                    converter.to_python('probe').pk
+        user = User.objects.create(username='probe')
+        with self.assertNumQueries(1):
+            self.assertEqual(lazy.to_python('probe').pk, user.pk)
+        # at most two misses are kept, probe1 is evicted by probe3
+        with self.assertNumQueries(4):
+            for username in ('probe1', 'probe2', 'probe3', 'probe1'):
+                with self.assertRaises(Http404):
+                    eager.to_python(username)
+        self.assertEqual(get_negative_cache().stats()['auth.user'], {'rejected': 2, 'entries': 2})
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, path_converter=False, **hints):
+        return 'replica' if path_converter else None
+
+
+class DatabaseRoutingTest(TestCase):
+    @override_settings(DATABASE_ROUTERS=['django_path_converters.tests.ReplicaRouter'])
+    def test_router_hint(self):
+        from django.contrib.auth.models import User
+        from django_path_converters.routing import read_queryset
+        user = get_converters()['auth.user'].to_python('1')
+        self.assertEqual((user._state.db, read_queryset(User).db, User.objects.db), ('replica', 'replica', 'default'))
+
+    @override_settings(PATH_CONVERTERS_DATABASES={'METHODS': {'get': 'replica'}, 'ROUTES': {'edit-user': 'default'}})
+    def test_method_and_route_overrides(self):
+        from django.contrib.auth.models import User
+        from django.test import RequestFactory
+        from django.urls import ResolverMatch
+        from django_path_converters.routing import finish_routing, read_database, route_database, start_routing
+        request = RequestFactory().get('/')
+        token = start_routing(request)
+        try:
+            self.assertEqual(read_database(User), 'replica')
+            self.assertEqual(read_database(User.objects.using('other')), 'other')
+            request.resolver_match = ResolverMatch(username_view, (), {}, url_name='edit-user')
+            route_database(request)
+            self.assertEqual(read_database(User), 'default')
+        finally:
+            finish_routing(token)
+        token = start_routing(RequestFactory().post('/'))
+        try:
+            self.assertEqual(read_database(User), 'default')
+        finally:
+            finish_routing(token)
+
+    @override_settings(PATH_CONVERTERS_DATABASES={'METHODS': {'get': 'replica'}})
+    def test_save_goes_to_the_write_database(self):
+        from django.contrib.auth.models import User
+        from django.db import connections
+        from django.test import RequestFactory
+        from django.test.utils import CaptureQueriesContext
+        from django_path_converters.routing import finish_routing, pin_writes, start_routing
+        user = User.objects.create(username='pinned')
+        # as if it is read from the replica in a GET request
+        user._state.db = 'replica'
+        token = start_routing(RequestFactory().get('/'))
+        try:
+            self.assertEqual(pin_writes(user)._state.db, 'default')
+        finally:
+            finish_routing(token)
+        with CaptureQueriesContext(connections['default']) as queries:
+            user.save()
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE'))
+
+
+class ReverseTest(TestCase):
+    urlconf = 'django.contrib.auth.urls'
+
+    def test_reverse_matches_django(self):
+        from django.urls import NoReverseMatch, reverse as django_reverse
+        from django_path_converters.reverse import reverse
+        for viewname, args, kwargs in (
+                ('login', None, None),
+                ('password_reset_confirm', None, {'uidb64': 'MQ', 'token': 'set-password'}),
+                ('password_reset_confirm', ['MQ', 'a b'], None),
+        ):
+            with self.subTest(viewname=viewname, args=args, kwargs=kwargs):
+                self.assertEqual(reverse(viewname, self.urlconf, args, kwargs), django_reverse(viewname, self.urlconf, args, kwargs))
+        with self.assertRaises(NoReverseMatch):
+            reverse('password_reset_confirm', self.urlconf, kwargs={'uidb64': 'a/b', 'token': 'c'})
+
+    def test_reverse_checks_uuid_strings(self):
+        from django.urls import NoReverseMatch, reverse as django_reverse
+        from django_path_converters.reverse import reverse
+        urlconf = 'django_path_converters.tests'
+        key = '075194d3-6885-417e-a8a8-6c931e272f00'
+        self.assertEqual(reverse('item', urlconf, kwargs={'key': key}), django_reverse('item', urlconf, kwargs={'key': key}))
+        for function in (django_reverse, reverse):
+            with self.subTest(function=function), self.assertRaises(NoReverseMatch):
+                function('item', urlconf, kwargs={'key': 'not-a-uuid/../x'})
@@ -0,0 +1,6 @@
+# set ROOT_URLCONF to this module, and PATH_CONVERTERS_TRIE_URLCONF to the URLconf to resolve with a trie
+from django.conf import settings
+
+from django_path_converters.resolvers import trie_urlpatterns
+
+urlpatterns = trie_urlpatterns(settings.PATH_CONVERTERS_TRIE_URLCONF)
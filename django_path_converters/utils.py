@@ -1,7 +1,8 @@
 from re import compile as recompile
-from typing import Union, Type
+from typing import Optional, Union, Type
 
-from django.db.models import Model, Manager, QuerySet
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Field, Model, Manager, QuerySet
 from django.db.models.options import Options
 
 
@@ -13,7 +14,7 @@ AllItemTypes = Union[Model, Type[Model], Options, Manager, QuerySet]
 def get_model(model: AllItemTypes) -> Type[Model]:
     if isinstance(model, Model):  # model *object*
         return type(model)
-    elif not issubclass(model, Model):  # not a model class
+    elif not isinstance(model, type) or not issubclass(model, Model):  # not a model class
         return model.model
     return model
 
@@ -39,6 +40,36 @@ def get_model_options(model: AllItemTypes) -> Options:
         return model
     return get_model(model)._meta
 
+def get_unique_field(model: AllItemTypes, field_name: str) -> Optional[Field]:
+    # the concrete unique field behind the lookup, if any, these can be fetched with an __in query
+    options = get_model_options(model)
+    if field_name == 'pk':
+        return options.pk
+    try:
+        field = options.get_field(field_name)
+    except FieldDoesNotExist:
+        return None
+    if getattr(field, 'concrete', False) and field.unique:
+        return field
+
+def project_queryset(model: AllItemTypes, only=(), defer=(), select_related=(), prefetch_related=()) -> QuerySet:
+    queryset = get_queryset_or_manager(get_model_or_queryset(model), '_default_manager').all()
+    if only:
+        queryset = queryset.only(*wrap_tuple(only))
+    if defer:
+        queryset = queryset.defer(*wrap_tuple(defer))
+    if select_related:
+        queryset = queryset.select_related(*wrap_tuple(select_related))
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*wrap_tuple(prefetch_related))
+    return queryset
+
+def has_deferred_fields(model: AllItemTypes) -> bool:
+    if isinstance(model, QuerySet):
+        names, defer = model.query.deferred_loading
+        return bool(names) or not defer
+    return False
+
 def strip_capture_groups(pattern: str) -> str:
     return REMOVE_CAPTURE_GROUPS.sub('(?:', pattern)
 